@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+try:
+    # If imported from ~/workspace
+    from src.fields import SK_Field, _state_arrays, _state_species
+    from src.force_terms import Force_Workspace
+    from src.profiling import NULL_PROFILER
+except ImportError:
+    # If imported from ~/workspace/src
+    from fields import SK_Field, _state_arrays, _state_species
+    from force_terms import Force_Workspace
+    from profiling import NULL_PROFILER
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writes stay atomic, but concurrent writers may drop each other's updates
+    fcntl = None
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'PYPARTICLESIM_AUTOTUNE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'pyparticlesim', 'autotune.json'),
+)
+
+
+class Force_Backend:
+    """
+    Base class for one way of evaluating SK_Field forces, selected by Auto_Tuned_Field.
+
+    A backend evaluates the compiled Force_Plan of its field for positions (N, 2),
+    masses (N,) and, with per-species parameter matrices, species ids (N,). It declares:
+        - name          : identifier stored in the tuning cache
+        - exact         : results equal the reference kernels up to round-off
+        - max_particles : largest N worth timing (default: None, no limit)
+    Subclasses register themselves with register_backend().
+    """
+
+    name = None
+    exact = True
+    max_particles = None
+
+    def __init__(self, field, accuracy=None):
+        self.field = field
+
+    def available(self, n):
+        """True if the backend applies to n particles with the current field parameters."""
+        return self.max_particles is None or n <= self.max_particles
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        """Forces (N, 2) at time t, written into out when given."""
+        raise NotImplementedError
+
+
+def _shadow_field(field, **options):
+    """SK_Field with its own plan and options sharing field's parameter dict (so changes propagate)."""
+    shadow = SK_Field(**options)
+    shadow.params = field.params
+    return shadow
+
+
+BACKENDS = []
+
+
+def register_backend(cls):
+    """Register a Force_Backend subclass as an Auto_Tuned_Field candidate."""
+    if cls.name is None:
+        raise ValueError(f"{cls.__name__} must declare a name")
+    BACKENDS.append(cls)
+    return cls
+
+
+@register_backend
+class Pairwise_Backend(Force_Backend):
+    """Python loop over pairs i < j (the per-pair path of SK_Field._pairwise_force()) with Newton's third law."""
+
+    name = 'pairwise'
+    max_particles = 32
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        forces = np.zeros((len(pos), 2)) if out is None else out
+        forces[:] = 0.0
+        plan = self.field.plan
+        if species is None:
+            species = np.zeros(len(pos), dtype=np.intp)
+        for i in range(len(pos)):
+            for j in range(i + 1, len(pos)):
+                f = plan.evaluate(pos[i:i+1], mass[i:i+1], pos[j:j+1], mass[j:j+1], t,
+                                  target_species=species[i:i+1], source_species=species[j:j+1])[0]
+                forces[i] += f
+                forces[j] -= f
+        return forces
+
+
+@register_backend
+class Vectorized_Backend(Force_Backend):
+    """Force_Plan tiles with fresh temporaries (SK_Field.compute_forces() without a workspace)."""
+
+    name = 'vectorized'
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        return self.field.plan.evaluate(pos, mass, pos, mass, t, out=out,
+                                        target_species=species, source_species=species)
+
+
+class _Workspace_Backend(Force_Backend):
+    """Force_Plan tiles of about tile_pairs pairs evaluated in a reused Force_Workspace."""
+
+    tile_pairs = None
+
+    def __init__(self, field, accuracy=None):
+        super().__init__(field, accuracy)
+        self.workspace = Force_Workspace()
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        return self.field.plan.evaluate(pos, mass, pos, mass, t, out=out, workspace=self.workspace,
+                                        target_species=species, source_species=species,
+                                        tile_pairs=self.tile_pairs)
+
+
+@register_backend
+class Small_Tile_Backend(_Workspace_Backend):
+    name = 'workspace[2^13]'
+    tile_pairs = 1 << 13
+
+
+@register_backend
+class Workspace_Backend(_Workspace_Backend):
+    """Force_Plan's default tile size."""
+    name = 'workspace[2^15]'
+    tile_pairs = 1 << 15
+
+
+@register_backend
+class Large_Tile_Backend(_Workspace_Backend):
+    name = 'workspace[2^17]'
+    tile_pairs = 1 << 17
+
+
+@register_backend
+class Threaded_Backend(Force_Backend):
+    """
+    Target rows split into one block per core, each evaluated by a thread with its own workspace.
+
+    NumPy ufuncs release the GIL, so the blocks run concurrently on multi-core machines.
+    """
+
+    name = 'threaded'
+
+    def __init__(self, field, accuracy=None):
+        super().__init__(field, accuracy)
+        self.threads = os.cpu_count() or 1
+        self._executor = None
+        self._workspaces = [Force_Workspace() for _ in range(self.threads)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
+    def available(self, n):
+        return self.threads > 1 and n >= 2 * self.threads
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        forces = np.empty((len(pos), 2)) if out is None else out
+        plan = self.field.plan
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads)
+        bounds = np.linspace(0, len(pos), self.threads + 1).astype(int)
+        blocks = [self._executor.submit(plan.evaluate, pos[a:b], mass[a:b], pos, mass, t,
+                                        out=forces[a:b], workspace=ws, source_species=species,
+                                        target_species=None if species is None else species[a:b])
+                  for a, b, ws in zip(bounds[:-1], bounds[1:], self._workspaces)]
+        for block in blocks:
+            block.result()
+        return forces
+
+
+@register_backend
+class Tabulated_Backend(Force_Backend):
+    """Workspace evaluation with expensive kernels interpolated from tables (see kernel_tables.py)."""
+
+    name = 'tabulated'
+    exact = False
+
+    def __init__(self, field, accuracy=None):
+        super().__init__(field, accuracy)
+        # Kernel error well inside the force accuracy budget; the harness verifies the force error
+        self.tabulated = _shadow_field(field, tabulation_tolerance=accuracy / 10) if accuracy else None
+        self.workspace = Force_Workspace()
+
+    def available(self, n):
+        return self.tabulated is not None and any(term.tabulate for term in self.field.plan.terms)
+
+    def evaluate(self, pos, mass, t, out, species=None):
+        return self.tabulated.plan.evaluate(pos, mass, pos, mass, t, out=out, workspace=self.workspace,
+                                            target_species=species, source_species=species)
+
+
+def machine_key():
+    """Identifies the machine a tuning result was measured on."""
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()} cpus|numpy {np.__version__}"
+
+
+def n_bucket(n):
+    """Power-of-two particle-count bucket [2^k, 2^(k+1)) containing n, as a string."""
+    low = 1 << max(n.bit_length() - 1, 0)
+    return f"{low}-{2 * low - 1}"
+
+
+class Tuning_Cache:
+    """
+    JSON file of tuning decisions keyed by machine, then by (N-bucket, term set, accuracy).
+
+    The file is rewritten atomically after every decision: each writer dumps to its own
+    temporary file in the cache directory and os.replace()s it over the cache. Under an
+    exclusive lock on a sidecar .lock file (where fcntl is available), the cache is re-read
+    and merged right before the replace, so concurrent writers such as parallel scan
+    workers do not lose each other's decisions. A failed write only costs a re-tune later.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        """
+        Args:
+            path: Cache file (default: ~/.cache/pyparticlesim/autotune.json or $PYPARTICLESIM_AUTOTUNE_CACHE)
+        """
+
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """Stored decision dict for key on this machine, or None."""
+        return self._load().get(machine_key(), {}).get(key)
+
+    def put(self, key, decision):
+        """Store a decision dict for key on this machine; returns False if the cache could not be written."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)   # Released when the lock file is closed
+                data = self._load()
+                data.setdefault(machine_key(), {})[key] = decision
+                with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as fh:
+                    tmp = fh.name
+                    json.dump(data, fh, indent=2)
+                os.replace(tmp, self.path)
+        except OSError as exc:
+            warnings.warn(f"Could not write autotune cache {self.path}: {exc}")
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+        return True
+
+
+class Auto_Tuned_Field:
+    """
+    Drop-in replacement for SK_Field that picks the fastest force backend for the actual problem.
+
+    On the first compute_forces() call for a problem (particle-count bucket and set of active
+    force terms), every registered Force_Backend that applies is timed on the actual state
+    and the fastest one is used from then on. With an accuracy constraint, inexact backends
+    (e.g. tabulated kernels) compete too, provided their max relative force error
+    |F - F_ref| / max|F_ref| against the vectorized exact kernels stays within it.
+
+    Decisions are cached per machine, N-bucket and term set in a JSON file, so later runs
+    reuse them without timing. The choice is re-checked whenever N leaves its power-of-two
+    bucket (e.g. after ensemble compaction or particle merging) or the parameters change
+    the term set. Energies and sensitivities are delegated to the exact SK_Field.
+    """
+
+    def __init__(self, profiler=None, accuracy=None, cache_path=DEFAULT_CACHE_PATH, trials=3,
+                 backends=None, **params):
+        """
+        Args:
+            profiler: Profiler recording compute_forces timing, pair counts and tuning (default: disabled)
+            accuracy: Max relative force error allowed for inexact backends (default: None, exact only)
+            cache_path: Tuning cache file, or None to time every new problem (default: DEFAULT_CACHE_PATH)
+            trials: Timed evaluations per backend; the minimum counts (default: 3)
+            backends: Force_Backend classes to choose from (default: all registered backends)
+            **params: Force parameters, as for SK_Field
+        """
+
+        self.field = SK_Field(**params)
+        self.profiler = profiler or NULL_PROFILER
+        self.accuracy = accuracy
+        self.cache = Tuning_Cache(cache_path) if cache_path is not None else None
+        self.trials = trials
+        self.backend_classes = list(backends or BACKENDS)
+        self._backends = None
+        self._key = None
+        self.backend = None
+        self.history = []   # One decision dict per (re)selection
+
+    def __getstate__(self):
+        # Worker processes re-select their backend (normally from the disk cache)
+        state = self.__dict__.copy()
+        state.update(profiler=NULL_PROFILER, _backends=None, _key=None, backend=None)
+        return state
+
+    @property
+    def params(self):
+        return self.field.params
+
+    @params.setter
+    def params(self, params):
+        self.field.params = params
+
+    @property
+    def plan(self):
+        return self.field.plan
+
+    @property
+    def SENSITIVITY_PARAMS(self):
+        return self.field.SENSITIVITY_PARAMS
+
+    def problem_key(self, n):
+        """Cache key of the problem: N-bucket, active terms (and whether they are tabulable), species and accuracy."""
+        plan = self.field.plan
+        terms = ','.join(f"{type(t).__name__}{'*' if t.tabulate else ''}" for t in plan.terms)
+        species = f"|species={plan.n_species}" if plan.n_species > 1 else ''
+        return f"N={n_bucket(n)}|{terms}{species}|accuracy={self.accuracy}"
+
+    def _candidates(self, n):
+        if self._backends is None:
+            self._backends = {cls.name: cls(self.field, self.accuracy) for cls in self.backend_classes}
+        return {name: b for name, b in self._backends.items()
+                if (b.exact or self.accuracy is not None) and b.available(n)}
+
+    def _tune(self, pos, mass, t, species, candidates):
+        """
+        Time every candidate on (pos, mass, species); returns (fastest name, timings, errors).
+
+        Candidates whose error exceeds the accuracy bound are not timed. If none passes, the
+        'vectorized' backend (the reference kernels) is chosen with a RuntimeWarning, or a
+        RuntimeError listing the errors is raised when it is not a candidate.
+        """
+        reference = self.field.plan.evaluate(pos, mass, pos, mass, t, target_species=species, source_species=species)
+        scale = max(np.abs(reference).max(initial=0.0), np.finfo(float).tiny)
+        out = np.empty_like(reference)
+        timings, errors = {}, {}
+        for name, backend in candidates.items():
+            forces = backend.evaluate(pos, mass, t, out, species)   # Warm-up (tables, buffers, threads)
+            errors[name] = float(np.abs(forces - reference).max(initial=0.0) / scale)
+            if self.accuracy is not None and errors[name] > self.accuracy:
+                continue
+            best = np.inf
+            for _ in range(self.trials):
+                start = time.perf_counter()
+                backend.evaluate(pos, mass, t, out, species)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+        if not timings:
+            failed = ', '.join(f"{name} {error:.2e}" for name, error in errors.items())
+            if Vectorized_Backend.name not in candidates:
+                raise RuntimeError(f"No backend meets accuracy {self.accuracy:g} (max relative errors: {failed})")
+            # Round-off alone exceeds the bound: fall back to the kernels the reference was computed with
+            warnings.warn(f"No backend meets accuracy {self.accuracy:g} (max relative errors: {failed}); "
+                          f"using the exact '{Vectorized_Backend.name}' backend", RuntimeWarning)
+            return Vectorized_Backend.name, timings, errors
+        return min(timings, key=timings.get), timings, errors
+
+    def _select(self, pos, mass, t, species, key):
+        candidates = self._candidates(len(pos))
+        decision = self.cache.get(key) if self.cache is not None else None
+        if decision is None or decision['backend'] not in candidates:
+            with self.profiler.phase('autotune'):
+                name, timings, errors = self._tune(pos, mass, t, species, candidates)
+            decision = {'backend': name, 'n': len(pos), 'timings': timings, 'errors': errors,
+                        'tuned': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            if self.cache is not None:
+                self.cache.put(key, decision)
+            source = 'tuned'
+        else:
+            source = 'cache'
+        self.history.append(dict(decision, key=key, source=source))
+        self.backend = candidates[decision['backend']]
+        self._key = key
+
+    def compute_forces(self, particles, time=0.0, out=None, workspace=None):
+        """
+        Compute all pairwise forces with the selected backend (tuning first if needed).
+
+        Args:
+            particles: Array of Particle objects or a Particle_State
+            time: Current simulation time (for time-varying forces)
+            out: Optional preallocated (N, 2) array receiving the forces
+            workspace: Accepted for SK_Field compatibility; backends keep their own workspaces
+
+        Returns:
+            Array of force vectors [Fx, Fy] for each particle
+        """
+
+        pos, mass = _state_arrays(particles)
+        n = len(pos)
+        species = _state_species(particles) if self.field.plan.n_species > 1 else None
+        key = self.problem_key(n)
+        if key != self._key:
+            self._select(pos, mass, time, species, key)
+
+        with self.profiler.phase('compute_forces'):
+            forces = self.backend.evaluate(pos, mass, time, out, species)
+
+        self.profiler.count('force_evaluations')
+        self.profiler.count('pair_interactions', n * (n - 1) // 2)
+        return forces
+
+    def compute_potential_energy(self, particles, time=0.0):
+        return self.field.compute_potential_energy(particles, time)
+
+    def compute_force_sensitivities(self, particles, tangents, time=0.0):
+        return self.field.compute_force_sensitivities(particles, tangents, time)
+
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+try:
+    # If imported from ~/workspace
+    from src.particles_and_structures import Particle_State
+except ImportError:
+    # If imported from ~/workspace/src
+    from particles_and_structures import Particle_State
+
+from collections import deque
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+
+import numpy as np
+
+
+class Local_Communicator:
+    """
+    In-process stand-in for an MPI communicator, connecting worker processes on one machine.
+
+    Every rank owns an inbox queue; point-to-point messages are tagged with their source and
+    buffered until the matching recv(). The method names and semantics follow mpi4py's
+    lowercase (pickle-based) API, so engine code written against this class runs unchanged
+    with mpi4py.MPI.COMM_WORLD. As with MPI, every rank must call collectives in the same order.
+    """
+
+    def __init__(self, rank, inboxes):
+        self.rank = rank
+        self.size = len(inboxes)
+        self._inboxes = inboxes
+        self._pending = {}
+
+    @classmethod
+    def create(cls, size):
+        """One communicator per rank, sharing a set of inbox queues (pass each to its process)."""
+        inboxes = [mp.Queue() for _ in range(size)]
+        return [cls(rank, inboxes) for rank in range(size)]
+
+    def send(self, obj, dest):
+        # Queue.put hands the message to a feeder thread, so sends never block on the receiver
+        self._inboxes[dest].put((self.rank, obj))
+
+    def recv(self, source):
+        pending = self._pending.get(source)
+        if pending:
+            return pending.popleft()
+        while True:
+            sender, obj = self._inboxes[self.rank].get()
+            if sender == source:
+                return obj
+            self._pending.setdefault(sender, deque()).append(obj)
+
+    def alltoall(self, sendobj):
+        """Send sendobj[d] to every rank d; returns the list of objects received from each rank."""
+        for dest in range(self.size):
+            if dest != self.rank:
+                self.send(sendobj[dest], dest)
+        return [sendobj[src] if src == self.rank else self.recv(src) for src in range(self.size)]
+
+    def allgather(self, sendobj):
+        """Every rank's sendobj, in rank order."""
+        return self.alltoall([sendobj] * self.size)
+
+
+# Per-particle record exchanged between domains: row, x, y, vx, vy, mass, ax, ay, species
+_ROW, _POS, _VEL, _MASS, _ACC, _SPECIES = 0, slice(1, 3), slice(3, 5), 5, slice(6, 8), 8
+_RECORD = 9
+
+
+def strip_decomposition(pos, n_domains, weights=None):
+    """
+    Split the plane into n_domains vertical strips holding equal total weight.
+
+    Args:
+        pos: (N, 2) positions
+        n_domains: Number of domains
+        weights: (N,) per-particle cost (default: uniform)
+
+    Returns:
+        (n_domains, 4) array of boxes [x_min, x_max, y_min, y_max]; outer edges are infinite
+    """
+
+    boxes = np.tile([-np.inf, np.inf, -np.inf, np.inf], (n_domains, 1))
+    cuts = _weighted_cuts(pos[:, 0], np.ones(len(pos)) if weights is None else weights,
+                          np.arange(1, n_domains) / n_domains)
+    boxes[1:, 0] = cuts
+    boxes[:-1, 1] = cuts
+    return boxes
+
+
+def orb_decomposition(pos, n_domains, weights=None):
+    """
+    Orthogonal recursive bisection into n_domains boxes holding equal total weight.
+
+    Each node is cut across its wider axis at the weighted quantile that splits its domain
+    count, so any number of domains (not only powers of two) is supported.
+
+    Args:
+        pos: (N, 2) positions
+        n_domains: Number of domains
+        weights: (N,) per-particle cost (default: uniform)
+
+    Returns:
+        (n_domains, 4) array of boxes [x_min, x_max, y_min, y_max]; outer edges are infinite
+    """
+
+    weights = np.ones(len(pos)) if weights is None else np.asarray(weights, dtype=float)
+    boxes = []
+
+    def bisect(box, points, w, n):
+        if n == 1:
+            boxes.append(box)
+            return
+        n_left = n // 2
+        spread = np.ptp(points, axis=0) if len(points) else np.zeros(2)
+        axis = int(spread[1] > spread[0])
+        cut = _weighted_cuts(points[:, axis], w, [n_left / n])[0]
+        left = points[:, axis] < cut
+        low, high = list(box), list(box)
+        low[2 * axis + 1] = cut
+        high[2 * axis] = cut
+        bisect(low, points[left], w[left], n_left)
+        bisect(high, points[~left], w[~left], n - n_left)
+
+    bisect([-np.inf, np.inf, -np.inf, np.inf], np.asarray(pos, dtype=float), weights, n_domains)
+    return np.array(boxes)
+
+
+DECOMPOSITIONS = {'strips': strip_decomposition, 'orb': orb_decomposition}
+
+
+def _weighted_cuts(x, weights, fractions):
+    """Coordinates splitting x into parts holding the given cumulative weight fractions."""
+    if len(x) == 0:
+        return np.zeros(len(fractions))
+    order = np.argsort(x, kind='stable')
+    xs = x[order]
+    cumulative = np.cumsum(weights[order])
+    idx = np.searchsorted(cumulative, np.asarray(fractions) * cumulative[-1], side='right')
+    idx = np.clip(idx, 1, len(xs) - 1) if len(xs) > 1 else np.zeros_like(idx)
+    # Midway between neighbours, so each particle lies strictly inside one domain
+    return 0.5 * (xs[idx - 1] + xs[idx])
+
+
+def owners(pos, boxes):
+    """Index of the box containing each position (boxes are half-open [min, max))."""
+    owner = np.zeros(len(pos), dtype=int)
+    for d, (x0, x1, y0, y1) in enumerate(boxes):
+        inside = (pos[:, 0] >= x0) & (pos[:, 0] < x1) & (pos[:, 1] >= y0) & (pos[:, 1] < y1)
+        owner[inside] = d
+    return owner
+
+
+def _box_distance_sq(pos, box):
+    x0, x1, y0, y1 = box
+    dx = np.maximum(np.maximum(x0 - pos[:, 0], pos[:, 0] - x1), 0.0)
+    dy = np.maximum(np.maximum(y0 - pos[:, 1], pos[:, 1] - y1), 0.0)
+    return dx*dx + dy*dy
+
+
+class _Domain_Worker:
+    """Velocity Verlet on the particles owned by one rank; runs inside a worker process."""
+
+    def __init__(self, comm, field, boxes, owned, dt, time, cutoff, method, rebalance_threshold, rebalance_interval):
+        self.comm = comm
+        self.plan = field.plan
+        self.boxes = boxes
+        self.owned = owned
+        self.dt = dt
+        self.time = time
+        self.cutoff = cutoff
+        self.method = method
+        self.rebalance_threshold = rebalance_threshold
+        self.rebalance_interval = rebalance_interval
+        self.stats = {'migrated': 0, 'halo': 0, 'rebalances': 0, 'force_time': 0.0, 'steps': 0}
+        self.n_sources = 0
+
+    def _migrate(self):
+        """Send particles that left this domain to their new owners."""
+        comm = self.comm
+        owner = owners(self.owned[:, _POS], self.boxes)
+        outgoing = [self.owned[owner == d] for d in range(comm.size)]
+        self.stats['migrated'] += len(self.owned) - len(outgoing[comm.rank])
+        self.owned = np.concatenate(comm.alltoall(outgoing))
+
+    def _halo(self):
+        """Positions, masses and species of other domains' particles that can interact with this domain."""
+        comm = self.comm
+        mine = self.owned[:, [1, 2, _MASS, _SPECIES]]
+        if self.cutoff is None:
+            received = comm.allgather(mine)
+        else:
+            outgoing = [mine[_box_distance_sq(mine, box) <= self.cutoff**2] if d != comm.rank else mine[:0]
+                        for d, box in enumerate(self.boxes)]
+            received = comm.alltoall(outgoing)
+        halo = np.concatenate([mine[:0]] + [r for src, r in enumerate(received) if src != comm.rank])
+        self.stats['halo'] += len(halo)
+        return halo
+
+    def _accelerations(self, t):
+        halo = self._halo()
+        owned = self.owned
+        source_pos = np.concatenate([owned[:, _POS], halo[:, :2]])
+        source_mass = np.concatenate([owned[:, _MASS], halo[:, 2]])
+        self.n_sources = len(source_pos)
+        species = {}
+        if self.plan.n_species > 1:
+            species = dict(target_species=owned[:, _SPECIES].astype(np.intp),
+                           source_species=np.concatenate([owned[:, _SPECIES], halo[:, 3]]).astype(np.intp))
+        start = time.perf_counter()
+        forces = self.plan.evaluate(owned[:, _POS], owned[:, _MASS], source_pos, source_mass, t, cutoff=self.cutoff,
+                                    **species)
+        self.stats['force_time'] += time.perf_counter() - start
+        return forces / owned[:, _MASS, None]
+
+    def _rebalance(self):
+        """Recompute the decomposition if pair work is unevenly spread across ranks."""
+        comm = self.comm
+        loads = np.array(comm.allgather(len(self.owned) * self.n_sources), dtype=float)
+        if loads.mean() == 0 or loads.max() / loads.mean() <= self.rebalance_threshold:
+            return
+        # Every rank sees the same gathered data and so computes the same new boxes
+        blocks = comm.allgather((self.owned, self.n_sources))
+        everything = np.concatenate([b for b, _ in blocks])
+        weights = np.concatenate([np.full(len(b), n, dtype=float) for b, n in blocks])
+        self.boxes = DECOMPOSITIONS[self.method](everything[:, _POS], comm.size, weights)
+        self.owned = everything[owners(everything[:, _POS], self.boxes) == comm.rank]
+        self.stats['rebalances'] += 1
+
+    def run(self, n_steps):
+        dt = self.dt
+        self.owned[:, _ACC] = self._accelerations(self.time)
+        for step in range(n_steps):
+            owned = self.owned
+            owned[:, _POS] += owned[:, _VEL] * dt + 0.5 * owned[:, _ACC] * dt**2
+            self._migrate()
+            if self.rebalance_interval and (step + 1) % self.rebalance_interval == 0:
+                self._rebalance()
+            accel_new = self._accelerations(self.time + dt)
+            owned = self.owned
+            owned[:, _VEL] += 0.5 * (owned[:, _ACC] + accel_new) * dt
+            owned[:, _ACC] = accel_new
+            self.time += dt
+            self.stats['steps'] += 1
+        return self.owned
+
+
+def _run_worker(comm, field, boxes, owned, dt, t0, n_steps, cutoff, method,
+                rebalance_threshold, rebalance_interval, results):
+    try:
+        worker = _Domain_Worker(comm, field, boxes, owned, dt, t0, cutoff, method,
+                                rebalance_threshold, rebalance_interval)
+        owned = worker.run(n_steps)
+        results.put((comm.rank, 'ok', (owned, worker.boxes, worker.stats)))
+    except Exception:
+        results.put((comm.rank, 'error', traceback.format_exc()))
+
+
+class Domain_Decomposed_Simulation:
+    """
+    Velocity Verlet engine distributing particles over worker processes by spatial domain.
+
+    The plane is partitioned into strips or an orthogonal recursive bisection (ORB), one
+    domain per worker. Each step a worker drifts its own particles, hands particles that
+    crossed a boundary to their new owner, receives halo particles from the other domains
+    and evaluates the SK_Field force terms (field.plan) on its own particles only:
+
+        - cutoff = None: the halo is every other particle, so forces are the exact long-range
+          SK_Field sums with the pair work split across workers
+        - cutoff = r_c: only particles within r_c of a domain are exchanged and pairs beyond
+          r_c are ignored (short-range runs). Only the halo exchange is cutoff-limited: each
+          worker still evaluates dense tiles over all its own particles and halo particles,
+          so its pair work stays O(N_local × (N_local + N_halo)), not O(N_local) neighbours
+
+    Every rebalance_interval steps the workers compare their pair work; if the busiest
+    exceeds rebalance_threshold × the mean, as happens when collapse packs particles into a
+    few domains, the domains are recomputed with per-particle weights equal to the
+    measured cost and particles are redistributed.
+
+    Communication goes through Local_Communicator, whose mpi4py-style methods make it a
+    drop-in stand-in for an MPI communicator. Workers are started for each run() call;
+    state, time and the current boxes persist on this object between calls. A worker that
+    raises, or dies without reporting (segfault, OOM kill), fails run() with a RuntimeError
+    and the remaining workers are terminated.
+    """
+
+    def __init__(self, particles, dt, field, n_workers=None, method='orb', cutoff=None,
+                 rebalance_threshold=1.25, rebalance_interval=10):
+        """
+        Args:
+            particles: Array of Particle objects or a Particle_State
+            dt: Timestep
+            field: SK_Field instance for force computation (must be picklable)
+            n_workers: Number of worker processes / domains (default: os.cpu_count())
+            method: Decomposition, 'orb' or 'strips' (default: 'orb')
+            cutoff: Interaction cutoff radius (default: None, all pairs)
+            rebalance_threshold: Max/mean pair-work ratio that triggers a rebalance (default: 1.25)
+            rebalance_interval: Steps between load checks; 0 disables rebalancing (default: 10)
+        """
+
+        if method not in DECOMPOSITIONS:
+            raise ValueError(f"Unknown decomposition method: {method}")
+
+        self.state = Particle_State.from_particles(particles)
+        self.dt = dt
+        self.field = field
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.method = method
+        self.cutoff = cutoff
+        self.rebalance_threshold = rebalance_threshold
+        self.rebalance_interval = rebalance_interval
+        self.time = 0.0
+        self.boxes = DECOMPOSITIONS[method](self.state.pos, self.n_workers)
+        self.history = []   # One report dict per run() call
+
+    @property
+    def particles(self):
+        """Array of Particle objects viewing the simulation state, in original particle order."""
+        return self.state.particles
+
+    def run(self, n_steps: int):
+        """
+        Advance n_steps velocity Verlet steps across the worker processes.
+
+        Returns:
+            Report dict with 'wall_time', 'counts' (particles per domain at the end),
+            'rebalances', 'migrated' (total boundary crossings), 'mean_halo' (halo
+            particles per worker per force evaluation) and 'force_time' per worker
+        """
+
+        start = time.perf_counter()
+        state = self.state
+        records = np.empty((len(state), _RECORD))
+        records[:, _ROW] = np.arange(len(state))
+        records[:, _POS] = state.pos
+        records[:, _VEL] = state.vel
+        records[:, _MASS] = state.mass
+        records[:, _SPECIES] = state.species
+        owner = owners(state.pos, self.boxes)
+
+        comms = Local_Communicator.create(self.n_workers)
+        results = mp.Queue()
+        workers = [
+            mp.Process(target=_run_worker, args=(
+                comms[rank], self.field, self.boxes, records[owner == rank], self.dt, self.time, n_steps,
+                self.cutoff, self.method, self.rebalance_threshold, self.rebalance_interval, results,
+            ))
+            for rank in range(self.n_workers)
+        ]
+        for w in workers:
+            w.start()
+
+        outputs = {}
+        lost = []
+        try:
+            while len(outputs) < self.n_workers:
+                try:
+                    rank, status, payload = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A rank's result is flushed before it exits, so one still missing a
+                    # full timeout after its exit was never sent
+                    dead = [r for r, w in enumerate(workers) if r not in outputs and w.exitcode is not None]
+                    if dead and dead == lost:
+                        raise RuntimeError(f"Domain worker {dead[0]} exited with code "
+                                           f"{workers[dead[0]].exitcode} without a result")
+                    lost = dead
+                    continue
+                if status == 'error':
+                    raise RuntimeError(f"Domain worker {rank} failed:\n{payload}")
+                outputs[rank] = payload
+        finally:
+            for w in workers:
+                if len(outputs) < self.n_workers:
+                    w.terminate()
+                w.join()
+
+        owned = np.concatenate([outputs[rank][0] for rank in range(self.n_workers)])
+        rows = owned[:, _ROW].astype(int)
+        state.pos[rows] = owned[:, _POS]
+        state.vel[rows] = owned[:, _VEL]
+        self.boxes = outputs[0][1]
+        self.time += n_steps * self.dt
+
+        stats = [outputs[rank][2] for rank in range(self.n_workers)]
+        evaluations = max(n_steps + 1, 1)
+        report = {
+            'wall_time': time.perf_counter() - start,
+            'counts': [len(outputs[rank][0]) for rank in range(self.n_workers)],
+            'rebalances': stats[0]['rebalances'],
+            'migrated': sum(s['migrated'] for s in stats),
+            'mean_halo': sum(s['halo'] for s in stats) / (self.n_workers * evaluations),
+            'force_time': [s['force_time'] for s in stats],
+        }
+        self.history.append(report)
+        return report
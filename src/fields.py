@@ -5,156 +5,194 @@ __author__ = "Kamyar Modjtahedzadeh"
 
 try:
     # If imported from ~/workspace
-    from src.particles_and_structures import Particle
+    from src.force_terms import FORCE_TERMS, compile_force_plan
+    from src.particles_and_structures import Particle_State
+    from src.profiling import NULL_PROFILER
 except ImportError:
     # If imported from ~/workspace/src
-    from particles_and_structures import Particle
+    from force_terms import FORCE_TERMS, compile_force_plan
+    from particles_and_structures import Particle_State
+    from profiling import NULL_PROFILER
 
 import numpy as np
 
 
+def _state_arrays(particles):
+    """Positions (N, 2) and masses (N,) from a Particle_State or an array of Particle objects."""
+    if isinstance(particles, Particle_State):
+        return particles.pos, particles.mass
+    pos = np.array([p.pos for p in particles], dtype=float).reshape(-1, 2)
+    mass = np.array([p.mass for p in particles], dtype=float)
+    return pos, mass
+
+
+def _state_species(particles):
+    """Species ids (N,) from a Particle_State or an array of Particle objects."""
+    if isinstance(particles, Particle_State):
+        return particles.species
+    return np.array([getattr(p, 'species', 0) for p in particles], dtype=np.intp)
+
+
+def _params_key(params):
+    """Hashable snapshot of a parameter dict, used to detect parameter changes."""
+    return tuple(sorted(
+        (name, value.tobytes() if isinstance(value, np.ndarray) else value)
+        for name, value in params.items()
+    ))
+
+
 class SK_Field:
     """
     Stateless field class for computing particle-particle interaction forces.
 
     Computes N-body forces based on provided parameters. Supports multiple
     force types simultaneously (gravity, attractive force, etc.).
+
+    Each force type is a registered Force_Term (see force_terms.py) activated by its
+    trigger parameter: 'G' (Gravity_Term), 'k_repulsive' (Repulsive_Term) and 'k_zeta'
+    (Time_Varying_Repulsive_Term). The active terms are compiled once into a Force_Plan
+    that shares pair geometry across terms and hoists time factors such as ζ(t) out of
+    the pair loop. The plan is recompiled automatically when self.params changes.
+
+    With tabulation_tolerance set, kernels that need a transcendental function per pair
+    (e.g. a non-integer repulsive_exponent) are evaluated by cubic interpolation from cached
+    tables instead (see kernel_tables.py). This bounds the kernel error for accuracy studies;
+    with NumPy's vectorized pow the exact kernel is usually the faster one.
+
+    For mixed systems, the couplings G, k_repulsive, k_zeta and the softenings may be
+    symmetric (S, S) matrices indexed by the particles' species ids (Particle_State.species);
+    scalars still apply to every pair.
     """
 
-    def __init__(self, **params):
+    def __init__(self, profiler=None, tabulation_tolerance=None, **params):
         """
         Args:
-            **params: Force parameters (e.g., G, grav_softening, k_attractive, attractive_softening)
+            profiler: Profiler recording compute_forces timing and pair counts (default: disabled)
+            tabulation_tolerance: Max relative kernel error for tabulated kernels (default: None, exact)
+            **params: Force parameters (e.g., G, grav_softening, k_repulsive, repulsive_softening)
         """
 
         self.params = params
-
-    def compute_forces(self, particles, time=0.0):
+        self.profiler = profiler or NULL_PROFILER
+        self.tabulation_tolerance = tabulation_tolerance
+        self._plan = None
+        self._plan_key = None
+
+    def __getstate__(self):
+        # Sent to worker processes (e.g. Parareal_Simulation): the plan is recompiled there
+        # and profilers stay in the process that owns them
+        state = self.__dict__.copy()
+        state.update(profiler=NULL_PROFILER, _plan=None, _plan_key=None)
+        return state
+
+    @property
+    def SENSITIVITY_PARAMS(self):
+        """Field parameters supported by compute_force_sensitivities()."""
+        return tuple(p for cls in FORCE_TERMS for p in cls.sensitivity_params)
+
+    @property
+    def plan(self):
+        """Force_Plan for the current parameters (compiled on first use and after any change)."""
+        key = (_params_key(self.params), self.tabulation_tolerance)
+        if key != self._plan_key:
+            self._plan = compile_force_plan(self.params, self.tabulation_tolerance)
+            self._plan_key = key
+        return self._plan
+
+    def compute_forces(self, particles, time=0.0, out=None, workspace=None):
         """
         Compute all pairwise forces for particle array.
 
         Args:
-            particles: Array of Particle objects
+            particles: Array of Particle objects or a Particle_State
             time: Current simulation time (for time-varying forces)
+            out: Optional preallocated (N, 2) array receiving the forces
+            workspace: Optional Force_Workspace reused for the pair temporaries
 
         Returns:
             Array of force vectors [Fx, Fy] for each particle
         """
 
-        n = len(particles)
-        forces = np.zeros((n, 2))
-
-        # Double loop over particle pairs
-        for i in range(n):
-            for j in range(i + 1, n):
-                # Compute pairwise force
-                f_ij = self._pairwise_force(particles[i], particles[j], time)
+        pos, mass = _state_arrays(particles)
+        n = len(pos)
+        plan = self.plan
+        species = _state_species(particles) if plan.n_species > 1 else None
 
-                # Newton's third law
-                forces[i] += f_ij
-                forces[j] -= f_ij
+        with self.profiler.phase('compute_forces'):
+            forces = plan.evaluate(pos, mass, pos, mass, time, out=out, workspace=workspace,
+                                   target_species=species, source_species=species)
 
+        self.profiler.count('force_evaluations')
+        self.profiler.count('pair_interactions', n * (n - 1) // 2)
         return forces
 
-    def _pairwise_force(self, p1, p2, time):
+    def compute_potential_energy(self, particles, time=0.0):
         """
-        Compute force on p1 due to p2.
+        Total pair potential energy Σ_{i<j} U_ij, with U_ij → 0 as r → ∞.
 
-        Checks self.params to determine which forces to include.
+        Args:
+            particles: Array of Particle objects or a Particle_State
+            time: Current simulation time (time-varying terms use their current strength)
         """
 
-        # Relative position
-        r_vec = p1.pos - p2.pos
-        r = np.linalg.norm(r_vec)
-
-        if r == 0:
-            return np.array([0.0, 0.0])
+        pos, mass = _state_arrays(particles)
+        plan = self.plan
+        species = _state_species(particles) if plan.n_species > 1 else None
+        return plan.potential_energy(pos, mass, time, species)
 
-        r_hat = r_vec / r
-        f_total = np.array([0.0, 0.0])
-
-        if 'G' in self.params:
-            f_total += self._gravity(p1, p2, r, r_hat)
-
-        if 'k_repulsive' in self.params:
-            f_total += self._repulsive(p1, p2, r, r_hat)
-
-        if 'k_zeta' in self.params:
-            f_total += self._time_varying_repulsive(p1, p2, r, r_hat, time)
-
-        return f_total
-
-    def _gravity(self, p1, p2, r, r_hat):
+    def _pairwise_force(self, p1, p2, time):
+        """Compute force on p1 due to p2."""
+        forces = self.plan.evaluate(
+            np.reshape(p1.pos, (1, 2)), np.reshape(p1.mass, 1),
+            np.reshape(p2.pos, (1, 2)), np.reshape(p2.mass, 1),
+            time,
+            target_species=[getattr(p1, 'species', 0)], source_species=[getattr(p2, 'species', 0)],
+        )
+        return forces[0]
+
+    def compute_force_sensitivities(self, particles, tangents, time=0.0):
         """
-        N-body gravitational force with softening.
+        Compute forward (tangent-linear) force sensitivities for field parameters.
 
-            Models mutual gravitational attraction between massive particles. Newton's law of universal gravitation 
-            describes the attractive force between any two masses.
+        For each parameter p with position tangent S = dr/dp, returns
 
-                $$
-                \vec{F}_{\mathrm{grav}} = -\frac{Gm_1m_2}{r^2 + \epsilon^2}\hat{r}
-                $$
+            dF/dp = J(r)·S + ∂F/∂p
 
-            where $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $G$ is the 
-            gravitational constant, $\epsilon$ is the softening length, and $m_1$, $m_2$ are particle masses. 
-            Softening prevents numerical divergence at small separations.
-        """
+        where J is the force Jacobian with respect to positions. Pair geometry is
+        evaluated once and shared across all requested parameters. Uses dense
+        (N, N) pair arrays, so memory scales as O(N²).
 
-        G = self.params['G']
-        epsilon = self.params.get('grav_softening', 0.01)
-        return -G * p1.mass * p2.mass / (r**2 + epsilon**2) * r_hat
+        Args:
+            particles: Array of Particle objects or a Particle_State
+            tangents: Dict mapping parameter name to (N, 2) position tangent dr/dp
+            time: Current simulation time (for time-varying forces)
 
-    def _repulsive(self, p1, p2, r, r_hat):
-        """
-        Softened repulsive force with configurable exponent:
-
-            Models a general repulsive interaction between particles with softening to prevent singularities.
-            This force opposes gravitational collapse and can represent electrostatic repulsion, degeneracy 
-            pressure, or contact forces.
-            
-                $$
-                \vec{F}_{\mathrm{repulsive}} = +\frac{|k_{\mathrm{r}}|}{r^\alpha + \epsilon_{\mathrm{r}}^\alpha} \hat{r}
-                $$
-            
-            where $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $k_{\mathrm{r}}$ is the 
-            repulsive coupling constant, $\epsilon_{\mathrm{r}}$ is the repulsive softening length, and $\alpha$ is the 
-            power-law exponent (default: 2 for inverse-square).
-            The positive sign creates repulsion (particles push apart). Softening prevents numerical divergence 
-            at small separations.
+        Returns:
+            Dict mapping parameter name to (N, 2) array of force sensitivities
         """
-        
-        k_r = self.params['k_repulsive']
-        epsilon_r = self.params.get('repulsive_softening', 0.01)
-        α = self.params.get('repulsive_exponent', 2)
-        return np.abs(k_r) / (r**α + epsilon_r**α) * r_hat
 
-    def _time_varying_repulsive(self, p1, p2, r, r_hat, time):
-        """
-        Time-varying repulsive force for breathing oscillations:
-
-            Models periodic modulation of repulsion strength to induce expansion-contraction cycles 
-            in N-body systems. The force magnitude varies sinusoidally with time.
-            
-                $$
-                \vec{F}_{\zeta} = |k_{\zeta}| \cdot \frac{\zeta(t)}{r^2 + \epsilon_{\zeta}^2} \hat{r}
-                $$
-            
-            where the modulating signal follows:
-            
-                $$
-                \zeta(t) = 1 + \sin(\omega t)
-                $$
-            
-            with $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $k_{\zeta}$ is the 
-            repulsive coupling constant, $\epsilon_{\zeta}$ is the softening length, and $\omega$ is the angular frequency.
-            The time-dependent modulation creates breathing oscillations in the particle system.
-        """
-        
-        k_zeta = self.params['k_zeta']
-        epsilon_zeta = self.params.get('zeta_softening', 0.01)
-        omega = self.params.get('omega_zeta', 1.0)
-        
-        # Compute modulating signal ζ(t)
-        zeta_t = 1.0 + np.sin(omega * time)
-        
-        return np.abs(k_zeta) * zeta_t / (r**2 + epsilon_zeta**2) * r_hat
\ No newline at end of file
+        for param in tangents:
+            if param not in self.SENSITIVITY_PARAMS:
+                raise ValueError(f"Unsupported sensitivity parameter: {param}")
+
+        pos, mass = _state_arrays(particles)
+        plan = self.plan
+        if plan.n_species > 1:
+            raise ValueError("Sensitivities are not supported with per-species parameter matrices")
+
+        # Force on i is Σ_j h(s_ij) r_vec_ij, so the pair Jacobian is h·I + 2(dh/ds) r_vec r_vecᵀ
+        dx, dy, s, r, h, dh_ds = plan.dense_kernels(pos, mass, time)
+        mm = mass[:, None] * mass[None, :]
+
+        sensitivities = {}
+        for param, tangent in tangents.items():
+            delta_x = tangent[:, 0, None] - tangent[None, :, 0]
+            delta_y = tangent[:, 1, None] - tangent[None, :, 1]
+            r_dot_delta = dx * delta_x + dy * delta_y
+            radial = 2.0 * dh_ds * r_dot_delta + plan.kernel_param_derivative(param, s, r, mm, time)
+            sensitivities[param] = np.column_stack([
+                np.einsum('ij,ij->i', h, delta_x) + np.einsum('ij,ij->i', radial, dx),
+                np.einsum('ij,ij->i', h, delta_y) + np.einsum('ij,ij->i', radial, dy),
+            ])
+
+        return sensitivities
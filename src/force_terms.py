@@ -0,0 +1,677 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+import copy
+
+import numpy as np
+
+
+class Force_Term:
+    """
+    Base class for central pair force terms used by SK_Field.
+
+    Every term has the form
+
+        F_ij = c(t) · [m_i m_j] · g(s) · r_vec,    s = r² = |r_i - r_j|²
+
+    i.e. a radial force magnitude f(r) = c(t)·[m_i m_j]·g(s)·r (positive = repulsive).
+    A term declares:
+        - trigger      : SK_Field parameter whose presence activates the term
+        - coefficient  : c(t) = coupling × time factor, evaluated once per force call
+        - shape        : kernel g(s) and its derivative dg/ds (shared r and r² are passed in)
+        - potential    : u(r) such that the pair energy is U = c(t)·[m_i m_j]·u(r), f = -dU/dr
+    Subclasses register themselves with register_force_term().
+
+    Couplings and softenings may be per-species-pair matrices (see species_matrix()); the
+    attributes that can hold them are listed in species_matrices, and at_species() resolves
+    them for one target species.
+    """
+
+    trigger = None               # Parameter activating the term
+    mass_coupled = False         # Multiply by m_i m_j
+    sensitivity_params = ()      # Parameters entering c(t), see coefficient_derivative()
+    tabulate = False             # Kernel is expensive enough to benefit from a Kernel_Table
+    species_matrices = ()        # Attributes that may hold (S, S) species matrices
+
+    def __init__(self, params):
+        self.params = params
+
+    def coupling(self):
+        """Time-independent coupling constant."""
+        raise NotImplementedError
+
+    def time_factor(self, time):
+        """Per-step modulation multiplying the coupling (hoisted out of the pair loop)."""
+        return 1.0
+
+    def coefficient(self, time):
+        """c(t) = coupling × time factor."""
+        return self.coupling() * self.time_factor(time)
+
+    def coefficient_derivative(self, param, time):
+        """∂c(t)/∂param for a parameter in sensitivity_params."""
+        raise NotImplementedError
+
+    def shape(self, s, r):
+        """Kernel g(s) with s = r² (r = √s supplied to avoid recomputation)."""
+        raise NotImplementedError
+
+    def shape_into(self, s, r, out):
+        """
+        Write g(s) into the preallocated array out (used by Force_Plan with a Force_Workspace).
+
+        The default calls shape() and copies; terms override it with in-place ufuncs so a
+        workspace evaluation allocates nothing per tile.
+        """
+        out[...] = self.shape(s, r)
+        return out
+
+    def shape_derivative(self, s, r):
+        """dg/ds."""
+        raise NotImplementedError
+
+    def potential(self, r):
+        """u(r) with U = c(t)·[m_i m_j]·u(r) and u(∞) = 0."""
+        raise NotImplementedError
+
+    def shape_key(self):
+        """Hashable tuple of the parameters g(s) depends on (identifies cached kernel tables)."""
+        raise NotImplementedError
+
+    def shape_length(self):
+        """Characteristic length of g(s), e.g. the softening length (sets the tabulated range)."""
+        return 1.0
+
+    def n_species(self):
+        """Number of species S of the species matrices (1 if every parameter is scalar)."""
+        values = [getattr(self, name) for name in self.species_matrices]
+        return max((len(v) for v in values if np.ndim(v) == 2), default=1)
+
+    def at_species(self, a, species):
+        """
+        The term acting on particles of species a from particles with the given species ids.
+
+        Returns self if no parameter is a species matrix, otherwise a copy in which every
+        matrix M is replaced by the (1, len(species)) row M[a, species], which broadcasts
+        across a tile of species-a targets and those sources.
+        """
+
+        matrices = [name for name in self.species_matrices if np.ndim(getattr(self, name)) == 2]
+        if not matrices:
+            return self
+        term = copy.copy(self)
+        for name in matrices:
+            setattr(term, name, getattr(self, name)[a, species][None, :])
+        return term
+
+
+FORCE_TERMS = []
+
+
+def register_force_term(cls):
+    """Register a Force_Term subclass so SK_Field compiles it when its trigger parameter is set."""
+    if cls.trigger is None:
+        raise ValueError(f"{cls.__name__} must declare a trigger parameter")
+    FORCE_TERMS.append(cls)
+    return cls
+
+
+def species_matrix(value, name):
+    """
+    A coupling or softening parameter as a scalar or a per-species-pair matrix.
+
+    Scalars (and 1 × 1 matrices) apply to every pair. An (S, S) matrix gives the value for
+    each pair of species a_i, a_j; it must be symmetric so that forces stay antisymmetric.
+    """
+
+    if np.ndim(value) == 0:
+        return value
+    matrix = np.array(value, dtype=float)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"{name} must be a scalar or a square (S, S) species matrix")
+    if not np.array_equal(matrix, matrix.T):
+        raise ValueError(f"{name} species matrix must be symmetric")
+    return float(matrix[0, 0]) if matrix.shape == (1, 1) else matrix
+
+
+def _softened_inverse_square_shape(s, r, epsilon):
+    """g(s) = 1/((s + ε²) r)."""
+    return 1.0 / ((s + epsilon**2) * r)
+
+
+def _softened_inverse_square_shape_into(s, r, epsilon, out):
+    np.add(s, epsilon**2, out=out)
+    out *= r
+    return np.reciprocal(out, out=out)
+
+
+def _softened_inverse_square_shape_derivative(s, r, epsilon):
+    u = s + epsilon**2
+    return -1.0 / (u**2 * r) - 0.5 / (u * r * s)
+
+
+def _softened_inverse_square_potential(r, epsilon):
+    """u(r) = (π/2 - arctan(r/ε))/ε, so that -du/dr = 1/(r² + ε²)."""
+    return (0.5*np.pi - np.arctan(r / epsilon)) / epsilon
+
+
+@register_force_term
+class Gravity_Term(Force_Term):
+    r"""
+    N-body gravitational force with softening.
+
+        Models mutual gravitational attraction between massive particles. Newton's law of universal gravitation
+        describes the attractive force between any two masses.
+
+            $$
+            \vec{F}_{\mathrm{grav}} = -\frac{Gm_1m_2}{r^2 + \epsilon^2}\hat{r}
+            $$
+
+        where $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $G$ is the
+        gravitational constant, $\epsilon$ is the softening length, and $m_1$, $m_2$ are particle masses.
+        Softening prevents numerical divergence at small separations.
+    """
+
+    trigger = 'G'
+    mass_coupled = True
+    sensitivity_params = ('G',)
+    species_matrices = ('G', 'epsilon')
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.G = species_matrix(params['G'], 'G')
+        self.epsilon = species_matrix(params.get('grav_softening', 0.01), 'grav_softening')
+
+    def coupling(self):
+        return -self.G
+
+    def coefficient_derivative(self, param, time):
+        return -1.0
+
+    def shape(self, s, r):
+        return _softened_inverse_square_shape(s, r, self.epsilon)
+
+    def shape_into(self, s, r, out):
+        return _softened_inverse_square_shape_into(s, r, self.epsilon, out)
+
+    def shape_derivative(self, s, r):
+        return _softened_inverse_square_shape_derivative(s, r, self.epsilon)
+
+    def potential(self, r):
+        return _softened_inverse_square_potential(r, self.epsilon)
+
+
+@register_force_term
+class Repulsive_Term(Force_Term):
+    r"""
+    Softened repulsive force with configurable exponent:
+
+        Models a general repulsive interaction between particles with softening to prevent singularities.
+        This force opposes gravitational collapse and can represent electrostatic repulsion, degeneracy
+        pressure, or contact forces.
+
+            $$
+            \vec{F}_{\mathrm{repulsive}} = +\frac{|k_{\mathrm{r}}|}{r^\alpha + \epsilon_{\mathrm{r}}^\alpha} \hat{r}
+            $$
+
+        where $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $k_{\mathrm{r}}$ is the
+        repulsive coupling constant, $\epsilon_{\mathrm{r}}$ is the repulsive softening length, and $\alpha$ is the
+        power-law exponent (default: 2 for inverse-square).
+        The positive sign creates repulsion (particles push apart). Softening prevents numerical divergence
+        at small separations.
+    """
+
+    trigger = 'k_repulsive'
+    sensitivity_params = ('k_repulsive',)
+
+    # Quadrature nodes and series length for the potential of non-inverse-square exponents
+    _GL_NODES, _GL_WEIGHTS = np.polynomial.legendre.leggauss(32)
+    _TAIL_TERMS = 60
+
+    species_matrices = ('k_r', 'epsilon')
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.k_r = species_matrix(params['k_repulsive'], 'k_repulsive')
+        self.epsilon = species_matrix(params.get('repulsive_softening', 0.01), 'repulsive_softening')
+        self.alpha = params.get('repulsive_exponent', 2)
+
+    @property
+    def tabulate(self):
+        # Non-inverse-square exponents need a transcendental pow per pair (tables need a scalar ε)
+        return self.alpha != 2 and np.ndim(self.epsilon) == 0
+
+    def shape_key(self):
+        return (self.epsilon, self.alpha)
+
+    def shape_length(self):
+        return self.epsilon
+
+    def coupling(self):
+        return np.abs(self.k_r)
+
+    def coefficient_derivative(self, param, time):
+        return np.sign(self.k_r)
+
+    def _r_alpha(self, s):
+        # Avoid the transcendental pow for the default inverse-square exponent
+        return s if self.alpha == 2 else s**(0.5*self.alpha)
+
+    def shape(self, s, r):
+        return 1.0 / ((self._r_alpha(s) + self.epsilon**self.alpha) * r)
+
+    def shape_into(self, s, r, out):
+        if self.alpha == 2:
+            return _softened_inverse_square_shape_into(s, r, self.epsilon, out)
+        np.power(s, 0.5*self.alpha, out=out)
+        out += self.epsilon**self.alpha
+        out *= r
+        return np.reciprocal(out, out=out)
+
+    def shape_derivative(self, s, r):
+        # r^α/u written as 1 - ε^α/u so the s → ∞ limit stays finite
+        α = self.alpha
+        u = self._r_alpha(s) + self.epsilon**α
+        return -0.5 / (u * r * s) * (α * (1.0 - self.epsilon**α / u) + 1.0)
+
+    def potential(self, r):
+        if self.alpha == 2:
+            return _softened_inverse_square_potential(r, self.epsilon)
+        if self.alpha <= 1:
+            raise ValueError("Repulsive potential diverges for repulsive_exponent <= 1")
+        # u(r) = ∫_r^∞ dx/(x^α + ε^α), split at R = max(r, 2ε)
+        α = self.alpha
+        r = np.asarray(r, dtype=float)
+        ε = np.broadcast_to(self.epsilon, r.shape)   # Per-pair softening rows with species matrices
+        R = np.maximum(r, 2*ε)
+
+        # Tail: 1/(x^α + ε^α) = Σ_n (-1)^n ε^{nα} x^{-α(n+1)}, converging since (ε/R)^α ≤ 2^{-α}
+        u = np.zeros_like(r)
+        ratio = (ε / R)**α
+        power = R**(1 - α)
+        for n in range(self._TAIL_TERMS):
+            u += (-1)**n * power / (α*(n + 1) - 1)
+            power = power * ratio
+
+        # Close pairs: Gauss-Legendre over [r, 2ε]
+        close = r < 2*ε
+        if np.any(close):
+            a = r[close][..., None]
+            e = ε[close][..., None]
+            x = 0.5*(2*e - a) * self._GL_NODES + 0.5*(2*e + a)
+            u[close] += 0.5*(2*e - a)[..., 0] * np.sum(self._GL_WEIGHTS / (x**α + e**α), axis=-1)
+        return u
+
+
+@register_force_term
+class Time_Varying_Repulsive_Term(Force_Term):
+    r"""
+    Time-varying repulsive force for breathing oscillations:
+
+        Models periodic modulation of repulsion strength to induce expansion-contraction cycles
+        in N-body systems. The force magnitude varies sinusoidally with time.
+
+            $$
+            \vec{F}_{\zeta} = |k_{\zeta}| \cdot \frac{\zeta(t)}{r^2 + \epsilon_{\zeta}^2} \hat{r}
+            $$
+
+        where the modulating signal follows:
+
+            $$
+            \zeta(t) = 1 + \sin(\omega t)
+            $$
+
+        with $\hat{r} = \frac{\vec{r}_1 - \vec{r}_2}{r}$ and $r = |\vec{r}_1 - \vec{r}_2|$, $k_{\zeta}$ is the
+        repulsive coupling constant, $\epsilon_{\zeta}$ is the softening length, and $\omega$ is the angular frequency.
+        The time-dependent modulation creates breathing oscillations in the particle system.
+    """
+
+    trigger = 'k_zeta'
+    sensitivity_params = ('k_zeta', 'omega_zeta')
+    species_matrices = ('k_zeta', 'epsilon')
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.k_zeta = species_matrix(params['k_zeta'], 'k_zeta')
+        self.epsilon = species_matrix(params.get('zeta_softening', 0.01), 'zeta_softening')
+        self.omega = params.get('omega_zeta', 1.0)
+
+    def coupling(self):
+        return np.abs(self.k_zeta)
+
+    def time_factor(self, time):
+        # Modulating signal ζ(t)
+        return 1.0 + np.sin(self.omega * time)
+
+    def coefficient_derivative(self, param, time):
+        if param == 'k_zeta':
+            return np.sign(self.k_zeta) * self.time_factor(time)
+        return np.abs(self.k_zeta) * time * np.cos(self.omega * time)   # omega_zeta
+
+    def shape(self, s, r):
+        return _softened_inverse_square_shape(s, r, self.epsilon)
+
+    def shape_into(self, s, r, out):
+        return _softened_inverse_square_shape_into(s, r, self.epsilon, out)
+
+    def shape_derivative(self, s, r):
+        return _softened_inverse_square_shape_derivative(s, r, self.epsilon)
+
+    def potential(self, r):
+        return _softened_inverse_square_potential(r, self.epsilon)
+
+
+class Force_Workspace:
+    """
+    Preallocated tile scratch for Force_Plan.evaluate().
+
+    Holds the pair geometry (Δx, Δy, r², r), kernel, mass-product and mask buffers of one
+    tile shape. Buffers are allocated on first use and again only when the tile shape
+    changes (i.e. when N changes), so repeated force evaluations of a fixed-size system
+    reuse the same memory through in-place ufuncs.
+    """
+
+    def __init__(self):
+        self.shape = None
+        self._scratch = {}
+
+    def tile(self, rows, n_sources):
+        """Buffers for tiles of up to rows × n_sources pairs."""
+        if self.shape != (rows, n_sources):
+            self.shape = (rows, n_sources)
+            self.dx, self.dy, self.s, self.r, self.h, self.g, self.mm = (np.empty(self.shape) for _ in range(7))
+            self.mask, self.mask_far = np.empty(self.shape, dtype=bool), np.empty(self.shape, dtype=bool)
+        return self
+
+    def view(self, name, m, n):
+        """Contiguous (m, n) view of the first m·n elements of a tile buffer (m·n ≤ tile size)."""
+        return getattr(self, name).reshape(-1)[:m * n].reshape(m, n)
+
+    def scratch(self, name, shape, dtype=float):
+        """Extra buffer of the given shape, allocated on first request and grown when too small."""
+        size = int(np.prod(shape))
+        array = self._scratch.get(name)
+        if array is None or array.size < size or array.dtype != dtype:
+            array = self._scratch[name] = np.empty(size, dtype=dtype)
+        return array[:size].reshape(shape)
+
+
+class Force_Plan:
+    """
+    Fused evaluation plan for the active force terms of one SK_Field parameter set.
+
+    Pair geometry (Δx, Δy, r², r) is computed once per tile of target rows and shared by all
+    terms; per-call factors c(t) are evaluated once before the pair loop. Mass-coupled and
+    mass-independent kernels are summed separately so m_i m_j is applied once.
+
+    When couplings or softenings are (S, S) species matrices, targets are grouped by
+    species once per call. For each target species a, every matrix is looked up once per
+    source as a row M[a, species_j] (species_plan()), which broadcasts across full-width
+    tiles, so the kernels stay branch-free and per-pair gathers are never needed. A lone
+    mass-coupled coupling row (e.g. a G matrix) is folded into the source masses, so it
+    costs nothing extra.
+    """
+
+    # Target rows per tile are chosen so a tile holds about this many pairs
+    TILE_PAIRS = 1 << 15
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        self.mass_terms = [t for t in self.terms if t.mass_coupled]
+        self.free_terms = [t for t in self.terms if not t.mass_coupled]
+        self.n_species = max((t.n_species() for t in self.terms), default=1)
+
+    def species_plan(self, a, source_species):
+        """Plan of the terms acting on species-a targets from sources with the given species ids."""
+        return Force_Plan([t.at_species(a, source_species) for t in self.terms])
+
+    def _tiles(self, n_targets, n_sources, pairs=None):
+        rows = max(1, (pairs or self.TILE_PAIRS) // max(n_sources, 1))
+        for start in range(0, n_targets, rows):
+            yield start, min(start + rows, n_targets)
+
+    def _species(self, species, n):
+        """Validated species ids of n particles (all 0 if None)."""
+        species = np.zeros(n, dtype=np.intp) if species is None else np.asarray(species)
+        if n and (species.min() < 0 or species.max() >= self.n_species):
+            raise ValueError(f"Species ids must lie in [0, {self.n_species}) for {self.n_species} × "
+                             f"{self.n_species} species matrices")
+        return species
+
+    def _species_blocks(self, species, n):
+        """
+        Grouping of n particles by species id.
+
+        Returns:
+            (order, blocks): the stable sorting permutation (None if already sorted) and a list
+            of (species, start, stop) row ranges in sorted order
+        """
+
+        species = self._species(species, n)
+        order = None
+        if np.any(species[1:] < species[:-1]):
+            order = np.argsort(species, kind='stable')
+            species = species[order]
+        bounds = np.searchsorted(species, np.arange(self.n_species + 1))
+        return order, [(a, lo, hi) for a, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])) if hi > lo]
+
+    @staticmethod
+    def _geometry(target_pos, source_pos, cutoff=None):
+        """
+        Δx, Δy, s = r² and r for a tile.
+
+        Coincident pairs, and pairs beyond cutoff if given, get s = r = ∞ so every kernel vanishes.
+        """
+        dx = target_pos[:, 0, None] - source_pos[None, :, 0]
+        dy = target_pos[:, 1, None] - source_pos[None, :, 1]
+        s = dx*dx + dy*dy
+        if cutoff is None:
+            s[s == 0.0] = np.inf
+        else:
+            s[(s == 0.0) | (s > cutoff * cutoff)] = np.inf
+        return dx, dy, s, np.sqrt(s)
+
+    @staticmethod
+    def _geometry_into(target_pos, source_pos, cutoff, ws):
+        """_geometry() written into views of the workspace buffers."""
+        shape = len(target_pos), len(source_pos)
+        dx, dy, s, r, mask = (ws.view(name, *shape) for name in ('dx', 'dy', 's', 'r', 'mask'))
+        np.subtract(target_pos[:, 0, None], source_pos[None, :, 0], out=dx)
+        np.subtract(target_pos[:, 1, None], source_pos[None, :, 1], out=dy)
+        np.multiply(dx, dx, out=s)
+        np.multiply(dy, dy, out=r)
+        s += r
+        np.equal(s, 0.0, out=mask)
+        if cutoff is not None:
+            far = ws.view('mask_far', *shape)
+            np.greater(s, cutoff * cutoff, out=far)
+            mask |= far
+        np.copyto(s, np.inf, where=mask)
+        np.sqrt(s, out=r)
+        return dx, dy, s, r
+
+    def _kernel_into(self, s, r, mm, coeffs_mass, coeffs_free, ws):
+        """kernel() accumulated into a view of the workspace kernel buffer."""
+        h, g = ws.view('h', *s.shape), ws.view('g', *s.shape)
+        h.fill(0.0)
+        for c, t in zip(coeffs_mass, self.mass_terms):
+            t.shape_into(s, r, g)
+            g *= c
+            h += g
+        if self.mass_terms:
+            h *= mm
+        for c, t in zip(coeffs_free, self.free_terms):
+            t.shape_into(s, r, g)
+            g *= c
+            h += g
+        return h
+
+    def kernel(self, s, r, mm, coeffs_mass, coeffs_free):
+        """Total kernel h(s) = Σ c·[m_i m_j]·g(s) for one tile."""
+        h = None
+        if self.mass_terms:
+            h = sum(c * t.shape(s, r) for c, t in zip(coeffs_mass, self.mass_terms)) * mm
+        for c, t in zip(coeffs_free, self.free_terms):
+            h = c * t.shape(s, r) if h is None else h + c * t.shape(s, r)
+        return h if h is not None else np.zeros_like(s)
+
+    def coefficients(self, time):
+        """Hoisted per-call coefficients (mass-coupled, mass-independent)."""
+        return ([t.coefficient(time) for t in self.mass_terms],
+                [t.coefficient(time) for t in self.free_terms])
+
+    def evaluate(self, target_pos, target_mass, source_pos, source_mass, time=0.0, out=None, cutoff=None,
+                 workspace=None, target_species=None, source_species=None, tile_pairs=None):
+        """
+        Forces on target particles due to all source particles.
+
+        Args:
+            target_pos, target_mass: (T, 2) and (T,) arrays
+            source_pos, source_mass: (S, 2) and (S,) arrays (may be the target arrays)
+            time: Current simulation time
+            out: Optional (T, 2) output array
+            cutoff: Ignore pairs farther apart than this (default: None, all pairs)
+            workspace: Force_Workspace whose buffers replace the per-tile temporaries (default: None)
+            target_species, source_species: (T,) and (S,) integer species ids indexing the
+                species matrices (default: None, all species 0; ignored without matrices)
+            tile_pairs: Pairs per tile (default: None, TILE_PAIRS)
+
+        Returns:
+            (T, 2) array of forces
+        """
+
+        n_t, n_s = len(target_pos), len(source_pos)
+        forces = np.zeros((n_t, 2)) if out is None else out
+        if out is not None:
+            forces[:] = 0.0
+        if not self.terms or n_t == 0 or n_s == 0:
+            return forces
+
+        pairs = tile_pairs
+        if workspace is not None:
+            workspace.tile(min(n_t, max(1, (tile_pairs or self.TILE_PAIRS) // n_s)), n_s)
+            pairs = workspace.shape[0] * workspace.shape[1]
+        if self.n_species == 1:
+            self._tile_forces(target_pos, target_mass, source_pos, source_mass, self.coefficients(time),
+                              cutoff, workspace, pairs, forces)
+            return forces
+
+        # One pass per target species, with species matrices resolved to per-source rows
+        t_order, t_blocks = self._species_blocks(target_species, n_t)
+        source_species = self._species(source_species, n_s)
+        sorted_forces = forces
+        if t_order is not None:
+            target_pos, target_mass = target_pos[t_order], target_mass[t_order]
+            sorted_forces = np.empty((n_t, 2)) if workspace is None else workspace.scratch('forces', (n_t, 2))
+        for a, lo, hi in t_blocks:
+            plan = self.species_plan(a, source_species)
+            coeffs_mass, coeffs_free = plan.coefficients(time)
+            mass = source_mass
+            if len(coeffs_mass) == 1 and np.ndim(coeffs_mass[0]) == 2:
+                # m_i·(c_j m_j) costs the same as m_i m_j
+                mass = source_mass * coeffs_mass[0][0] if workspace is None else \
+                    np.multiply(source_mass, coeffs_mass[0][0], out=workspace.scratch('source_mass', (n_s,)))
+                coeffs_mass = [1.0]
+            plan._tile_forces(target_pos[lo:hi], target_mass[lo:hi], source_pos, mass, (coeffs_mass, coeffs_free),
+                              cutoff, workspace, pairs, sorted_forces[lo:hi])
+        if t_order is not None:
+            forces[t_order] = sorted_forces
+        return forces
+
+    def _tile_forces(self, target_pos, target_mass, source_pos, source_mass, coeffs, cutoff, workspace, pairs,
+                     forces):
+        """Tile loop of evaluate(): forces from source_pos written into forces."""
+        coeffs_mass, coeffs_free = coeffs
+        n_s = len(source_pos)
+        for start, stop in self._tiles(len(target_pos), n_s, pairs):
+            m = stop - start
+            if workspace is not None:
+                dx, dy, s, r = self._geometry_into(target_pos[start:stop], source_pos, cutoff, workspace)
+                mm = None
+                if self.mass_terms:
+                    mm = np.multiply(target_mass[start:stop, None], source_mass[None, :],
+                                     out=workspace.view('mm', m, n_s))
+                h = self._kernel_into(s, r, mm, coeffs_mass, coeffs_free, workspace)
+                np.einsum('ij,ij->i', h, dx, out=forces[start:stop, 0])
+                np.einsum('ij,ij->i', h, dy, out=forces[start:stop, 1])
+                continue
+
+            dx, dy, s, r = self._geometry(target_pos[start:stop], source_pos, cutoff)
+            mm = target_mass[start:stop, None] * source_mass[None, :] if self.mass_terms else None
+            h = self.kernel(s, r, mm, coeffs_mass, coeffs_free)
+            forces[start:stop, 0] = np.einsum('ij,ij->i', h, dx)
+            forces[start:stop, 1] = np.einsum('ij,ij->i', h, dy)
+
+    def potential_energy(self, pos, mass, time=0.0, species=None):
+        """Total pair potential energy Σ_{i<j} U_ij of one particle set (species as in evaluate())."""
+        if self.n_species == 1:
+            return 0.5 * self._pair_energy(pos, mass, pos, mass, time)   # Every pair is visited twice
+        order, blocks = self._species_blocks(species, len(pos))
+        if order is not None:
+            pos, mass, species = pos[order], mass[order], np.asarray(species)[order]
+        species = self._species(species, len(pos))
+        energy = sum(self.species_plan(a, species)._pair_energy(pos[lo:hi], mass[lo:hi], pos, mass, time)
+                     for a, lo, hi in blocks)
+        return 0.5 * energy
+
+    def _pair_energy(self, target_pos, target_mass, source_pos, source_mass, time):
+        """Σ U_ij over all target-source pairs."""
+        energy = 0.0
+        coeffs_mass, coeffs_free = self.coefficients(time)
+        for start, stop in self._tiles(len(target_pos), len(source_pos)):
+            _, _, s, r = self._geometry(target_pos[start:stop], source_pos)
+            if self.mass_terms:
+                mm = target_mass[start:stop, None] * source_mass[None, :]
+                energy += np.sum(mm * sum(c * t.potential(r) for c, t in zip(coeffs_mass, self.mass_terms)))
+            for c, t in zip(coeffs_free, self.free_terms):
+                energy += c * np.sum(t.potential(r)) if np.ndim(c) == 0 else np.sum(c * t.potential(r))
+        return energy
+
+    def dense_kernels(self, pos, mass, time):
+        """
+        Dense (N, N) pair geometry and kernel data for the tangent-linear equations.
+
+        Returns:
+            (dx, dy, s, r, h, dh_ds) with h the total kernel and dh_ds its derivative in s
+        """
+
+        dx, dy, s, r = self._geometry(pos, pos)
+        mm = mass[:, None] * mass[None, :]
+        h = np.zeros_like(s)
+        dh_ds = np.zeros_like(s)
+        for term in self.terms:
+            c = term.coefficient(time) * (mm if term.mass_coupled else 1.0)
+            h += c * term.shape(s, r)
+            dh_ds += c * term.shape_derivative(s, r)
+        return dx, dy, s, r, h, dh_ds
+
+    def kernel_param_derivative(self, param, s, r, mm, time):
+        """∂h/∂param for the terms whose coefficient depends on param."""
+        dh_dp = np.zeros_like(s)
+        for term in self.terms:
+            if param in term.sensitivity_params:
+                c = term.coefficient_derivative(param, time) * (mm if term.mass_coupled else 1.0)
+                dh_dp += c * term.shape(s, r)
+        return dh_dp
+
+
+def compile_force_plan(params, tabulation_tolerance=None):
+    """
+    Compile the registered force terms activated by params into a Force_Plan.
+
+    Args:
+        params: SK_Field parameter dict
+        tabulation_tolerance: If set, terms with tabulate = True evaluate their kernel from a
+            cached Kernel_Table with this maximum relative error (default: None, exact kernels)
+    """
+
+    terms = [cls(params) for cls in FORCE_TERMS if cls.trigger in params]
+    if tabulation_tolerance is not None:
+        try:
+            from src.kernel_tables import tabulate_term
+        except ImportError:
+            from kernel_tables import tabulate_term
+        terms = [tabulate_term(t, tabulation_tolerance) if t.tabulate else t for t in terms]
+    return Force_Plan(terms)
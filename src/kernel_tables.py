@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+try:
+    # If imported from ~/workspace
+    from src.force_terms import Force_Term
+except ImportError:
+    # If imported from ~/workspace/src
+    from force_terms import Force_Term
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+
+class Kernel_Table:
+    """
+    Tabulated force magnitude f(s) = g(s)·r of one force term as a function of s = r².
+
+    The grid is nonuniform in s: octaves [2^(e-1), 2^e) split into K = 2^b equal cells, so
+    the cell index is read straight from the exponent and top b mantissa bits of s instead
+    of a log.
+    Each cell stores the cubic Hermite polynomial through f and df/ds at its end nodes,
+    evaluated by Horner's rule. K is doubled until the relative error at interior check
+    points is below the requested tolerance. Values of s outside [s_min, s_max] fall
+    back to the exact kernel.
+    """
+
+    MAX_CELLS_PER_OCTAVE = 1 << 14
+
+    def __init__(self, term, tolerance, s_min, s_max):
+        """
+        Args:
+            term: Force_Term providing shape(s, r) and shape_derivative(s, r)
+            tolerance: Maximum relative interpolation error of f(s)
+            s_min, s_max: Tabulated range of s = r²
+        """
+
+        self.term = term
+        self.tolerance = tolerance
+        self.e_min = int(np.frexp(s_min)[1])
+        self.e_max = int(np.frexp(s_max)[1])
+        self.s_min = np.ldexp(0.5, self.e_min)
+        self.s_max = np.ldexp(0.5, self.e_max)
+        self._s_top = np.nextafter(self.s_max, 0.0)   # Largest s inside the last cell
+        self._local = threading.local()                # Per-thread shape_into() scratch buffers
+
+        k = 8
+        while True:
+            self._build(k)
+            if self.max_error <= tolerance or k >= self.MAX_CELLS_PER_OCTAVE:
+                break
+            k *= 2
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _exact(self, s):
+        """Exact f(s) and df/ds."""
+        r = np.sqrt(s)
+        g = self.term.shape(s, r)
+        dg = self.term.shape_derivative(s, r)
+        return g * r, dg * r + 0.5 * g / r
+
+    def _build(self, k):
+        self.cells_per_octave = k
+        # Global cell index of s_min = 2^(e_min - 1), whose IEEE biased exponent is e_min + 1022
+        self._cell_base = (self.e_min + 1022) * k
+        # For positive doubles the bits above the top log2(K) mantissa bits read as
+        # (biased exponent)·K + (cell within the octave), i.e. a global cell index
+        self._shift = 52 - k.bit_length() + 1
+        self._mask = (1 << self._shift) - 1
+        self._scale = 1.0 / (1 << self._shift)
+        octaves = self.e_max - self.e_min
+        # Node s-values: 2^(e-1) · (1 + j/K) for each octave, plus the final endpoint
+        e = np.repeat(np.arange(self.e_min, self.e_max), k)
+        j = np.tile(np.arange(k), octaves)
+        nodes = np.append(np.ldexp(0.5 * (1.0 + j / k), e), self.s_max)
+        f, df = self._exact(nodes)
+        width = np.diff(nodes)
+
+        # Cubic in local t ∈ [0, 1): f = c0 + c1 t + c2 t² + c3 t³, one array per coefficient
+        f0, f1 = f[:-1], f[1:]
+        m0, m1 = df[:-1] * width, df[1:] * width
+        self.coeffs = (
+            f0,
+            m0,
+            3*(f1 - f0) - 2*m0 - m1,
+            2*(f0 - f1) + m0 + m1,
+        )
+
+        # Error at interior check points of every cell
+        checks = []
+        for frac in (0.25, 0.5, 0.75):
+            s = nodes[:-1] + frac * width
+            exact, _ = self._exact(s)
+            approx = self._interpolate(s)
+            checks.append(np.abs(approx - exact) / np.maximum(np.abs(exact), np.finfo(float).tiny))
+        self.max_error = float(np.max(checks))
+
+    def _interpolate(self, s):
+        """Table lookup for s inside [s_min, s_max)."""
+        bits = s.view(np.int64)
+        cell = (bits >> self._shift) - self._cell_base
+        t = (bits & self._mask) * self._scale
+        c0, c1, c2, c3 = (np.take(c, cell) for c in self.coeffs)
+        return c0 + t * (c1 + t * (c2 + t * c3))
+
+    def shape(self, s, r):
+        """Kernel g(s) = f(s)/r, tabulated inside the range and exact outside it."""
+        # Clipping maps coincident pairs (s = r = ∞) into the table; dividing by r = ∞ zeroes them
+        s_clipped = np.clip(s, self.s_min, self._s_top)
+        g = self._interpolate(s_clipped) / r
+        clipped = s_clipped != s
+        if np.any(clipped):
+            outside = clipped & np.isfinite(s)
+            if np.any(outside):
+                g[outside] = self.term.shape(s[outside], r[outside])
+        return g
+
+    def _scratch(self, shape):
+        """This thread's (cell, t, coefficient, flag) buffers for shape_into(), grown as needed."""
+        size = int(np.prod(shape))
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0].size < size:
+            buffers = self._local.buffers = (np.empty(size, dtype=np.int64), np.empty(size), np.empty(size),
+                                             np.empty(size, dtype=bool))
+        return [b[:size].reshape(shape) for b in buffers]
+
+    def shape_into(self, s, r, out):
+        """shape() written into out, fused into reused scratch buffers so a tile allocates nothing."""
+        cell, t, c, flag = self._scratch(s.shape)
+        bits = np.clip(s, self.s_min, self._s_top, out=out).view(np.int64)
+        np.bitwise_and(bits, self._mask, out=cell)
+        np.multiply(cell, self._scale, out=t)
+        np.right_shift(bits, self._shift, out=cell)
+        cell -= self._cell_base
+
+        # Horner's rule, gathering one coefficient array at a time ('clip' skips take's buffering)
+        c0, c1, c2, c3 = self.coeffs
+        np.take(c3, cell, out=out, mode='clip')
+        for coeff in (c2, c1, c0):
+            out *= t
+            out += np.take(coeff, cell, out=c, mode='clip')
+        out /= r   # Coincident pairs (s = r = ∞) clip into the table and vanish here
+
+        # Finite s outside the table falls back to the exact kernel (rare: the range is wide)
+        outside = np.flatnonzero(np.greater(s, self._s_top, out=flag))
+        outside = outside[np.isfinite(s.flat[outside])]
+        if s.min() < self.s_min:
+            outside = np.concatenate([outside, np.flatnonzero(np.less(s, self.s_min, out=flag))])
+        if len(outside):
+            out.flat[outside] = self.term.shape(s.flat[outside], r.flat[outside])
+        return out
+
+
+class Tabulated_Term(Force_Term):
+    """
+    Force term evaluating its kernel from a Kernel_Table.
+
+    Coefficients, time factors, derivatives and potentials are delegated to the exact
+    term; only the per-pair kernel g(s) is interpolated. Tables need a scalar softening,
+    but couplings may be species matrices: at_species() wraps the exact term's rows around
+    the same table.
+    """
+
+    def __init__(self, term, table):
+        super().__init__(term.params)
+        self.term = term
+        self.table = table
+        self.trigger = term.trigger
+        self.mass_coupled = term.mass_coupled
+        self.sensitivity_params = term.sensitivity_params
+
+    def coupling(self):
+        return self.term.coupling()
+
+    def n_species(self):
+        return self.term.n_species()
+
+    def at_species(self, a, species):
+        term = self.term.at_species(a, species)
+        return self if term is self.term else Tabulated_Term(term, self.table)
+
+    def time_factor(self, time):
+        return self.term.time_factor(time)
+
+    def coefficient_derivative(self, param, time):
+        return self.term.coefficient_derivative(param, time)
+
+    def shape(self, s, r):
+        return self.table.shape(s, r)
+
+    def shape_into(self, s, r, out):
+        return self.table.shape_into(s, r, out)
+
+    def shape_derivative(self, s, r):
+        return self.term.shape_derivative(s, r)
+
+    def potential(self, r):
+        return self.term.potential(r)
+
+
+# Tables shared between fields, keyed by (term class, shape parameters, tolerance)
+_TABLE_CACHE = OrderedDict()
+_TABLE_CACHE_SIZE = 32
+
+
+def tabulate_term(term, tolerance, length_scale=1.0):
+    """
+    Wrap term in a Tabulated_Term, reusing a cached table for the same shape parameters.
+
+    The table spans r from 10⁻³ × shape_length() up to 10⁴ × max(shape_length(), length_scale).
+
+    Args:
+        term: Force_Term with tabulate = True
+        tolerance: Maximum relative interpolation error
+        length_scale: Characteristic length of the system (default: 1.0)
+    """
+
+    key = (type(term).__name__, term.shape_key(), tolerance, length_scale)
+    table = _TABLE_CACHE.get(key)
+    if table is None:
+        length = term.shape_length()
+        table = Kernel_Table(term, tolerance, (1e-3 * length)**2, (1e4 * max(length, length_scale))**2)
+        _TABLE_CACHE[key] = table
+        if len(_TABLE_CACHE) > _TABLE_CACHE_SIZE:
+            _TABLE_CACHE.popitem(last=False)
+    else:
+        _TABLE_CACHE.move_to_end(key)
+    return Tabulated_Term(term, table)
+
+
+def clear_table_cache():
+    """Drop all cached kernel tables."""
+    _TABLE_CACHE.clear()
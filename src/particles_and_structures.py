@@ -3,6 +3,15 @@
 
 __author__ = "Kamyar Modjtahedzadeh"
 
+try:
+    # If imported from ~/workspace
+    from src.profiling import NULL_PROFILER
+except ImportError:
+    # If imported from ~/workspace/src
+    from profiling import NULL_PROFILER
+
+import inspect
+import weakref
 import numpy as np
 
 
@@ -14,20 +23,23 @@ class Particle:
     to be summed before updating motion.
     """
 
-    def __init__(self, position=(0.0, 0.0), velocity=(0.0, 0.0), mass=1.0, radius=1.0):
+    def __init__(self, position=(0.0, 0.0), velocity=(0.0, 0.0), mass=1.0, radius=1.0, species=0):
         """
         Args:
             position : [x, y] array-like (default: [0, 0])
             velocity : [vx, vy] array-like (default: [0, 0])
             mass     : particle mass (default: 1.0)
             radius   : particle radius (default: 1.0)
+            species  : integer species id indexing SK_Field species matrices (default: 0)
         """
 
         self.pos = np.array(position, dtype=float)   # [x, y]
         self.vel = np.array(velocity, dtype=float)   # [vx, vy]
         self.mass = mass
         self.radius = radius
+        self.species = species
         self.force = np.array([0.0, 0.0])            # [fx, fy] accumulator
+        self._state = None                           # Particle_State this particle views, if any
 
     #def reset_force(self):
     #    self.force = np.array([0.0, 0.0])
@@ -49,7 +61,6 @@ class Particle:
 
     def apply_forces(self, dt, *forces, method='standard_euler'):
         """Apply forces, advance particle, then reset force accumulator."""
-        forces = np.array(forces)     # Make sure array of forces is a NumPy array
         self.force[:] = 0.0
         for f in forces:
             self.force += f
@@ -57,32 +68,246 @@ class Particle:
         self.force[:] = 0.0
 
 
+class Particle_State:
+    """
+    Array-backed storage for a system of particles.
+
+    Positions and velocities live in contiguous (N, 2) arrays, masses, radii and integer
+    species ids in (N,) arrays. Particle objects are created lazily on first access to
+    `particles`, with each Particle's pos and vel bound to row views of the state arrays, so
+    per-particle code and vectorized code see the same data. Particle.mass, Particle.radius
+    and Particle.species are copies; change them through the state arrays.
+
+    Rows may be reordered for memory locality (see permute()); `ids` holds the original
+    index of the particle in each row, and by_id() maps per-row results back to it.
+    `particles` always lists the Particle objects in original order (particles[i] is
+    particle i); only the state arrays and row_particles follow the storage order.
+    """
+
+    def __init__(self, pos, vel=None, mass=1.0, radius=1.0, species=0):
+        """
+        Args:
+            pos     : (N, 2) array of positions
+            vel     : (N, 2) array or single [vx, vy] for all particles (default: zeros)
+            mass    : (N,) array or scalar (default: 1.0)
+            radius  : (N,) array or scalar (default: 1.0)
+            species : (N,) integer array or scalar species id (default: 0)
+        """
+
+        self.pos = np.array(pos, dtype=float).reshape(-1, 2)
+        n = len(self.pos)
+        self.vel = np.zeros((n, 2)) if vel is None else np.array(np.broadcast_to(vel, (n, 2)), dtype=float)
+        self.mass = np.array(np.broadcast_to(mass, (n,)), dtype=float)
+        self.radius = np.array(np.broadcast_to(radius, (n,)), dtype=float)
+        self.species = np.array(np.broadcast_to(species, (n,)), dtype=np.intp)
+        self.ids = np.arange(n)   # Original particle index of each row
+        self._particles = None    # Particle objects in row order
+        self._reordered = False   # Rows differ from the original order
+        self._by_id = None        # Particle objects in original order, cached while reordered
+
+    @classmethod
+    def from_particles(cls, particles):
+        """
+        Build a state from existing Particle objects, rebinding them to views of the new arrays.
+
+        Every Particle is bound to at most one state. A Particle_State passed in is returned
+        unchanged, and so is the state owning the particles when given exactly its
+        `particles` (e.g. a structure's); Particles bound to some other state are copied,
+        so that state keeps its bindings and never goes stale.
+        """
+
+        if isinstance(particles, cls):
+            return particles
+        particles = np.array(particles)
+        owner = getattr(particles[0], '_state', None) if len(particles) else None
+        if owner is not None and len(owner) == len(particles) and \
+                all(p is q for p, q in zip(particles, owner.particles)):
+            return owner
+        if any(getattr(p, '_state', None) is not None for p in particles):
+            particles = np.array([Particle(p.pos, p.vel, p.mass, p.radius, getattr(p, 'species', 0))
+                                  for p in particles])
+        state = cls(
+            [p.pos for p in particles],
+            [p.vel for p in particles],
+            [p.mass for p in particles],
+            [p.radius for p in particles],
+            [getattr(p, 'species', 0) for p in particles],
+        )
+        state._bind(particles)
+        return state
+
+    @property
+    def particles(self):
+        """Array of Particle objects in original particle order, viewing the state arrays."""
+        rows = self.row_particles
+        if not self._reordered:
+            return rows
+        if self._by_id is None:
+            self._by_id = self.by_id(rows)
+        return self._by_id
+
+    @property
+    def row_particles(self):
+        """Array of Particle objects in storage (row) order, viewing the state arrays (created on first access)."""
+        if self._particles is None:
+            particles = np.empty(len(self), dtype=object)
+            for i in range(len(self)):
+                particles[i] = Particle(mass=float(self.mass[i]), radius=float(self.radius[i]),
+                                        species=int(self.species[i]))
+            self._bind(particles)
+        return self._particles
+
+    def _bind(self, particles):
+        """Point each particle's pos and vel at its row of the state arrays."""
+        for i, particle in enumerate(particles):
+            particle.pos = self.pos[i]
+            particle.vel = self.vel[i]
+            particle._state = self   # Owning state, see from_particles()
+        self._particles = particles
+
+    def permute(self, order):
+        """
+        Reorder the rows in place so that new row i holds the particle previously in row order[i].
+
+        The state arrays keep their identity (views held elsewhere stay valid) and existing
+        Particle objects are rebound, so each one still sees its own particle's data.
+        """
+
+        for array in (self.pos, self.vel, self.mass, self.radius, self.species, self.ids):
+            array[:] = array[order]
+        if self._particles is not None:
+            self._bind(self._particles[order])
+        self._reordered = not np.array_equal(self.ids, np.arange(len(self)))
+        self._by_id = None
+
+    def by_id(self, values):
+        """Reorder per-row values (first axis of length N) into original particle index order."""
+        values = np.asarray(values)
+        out = np.empty_like(values)
+        out[self.ids] = values
+        return out
+
+    def __len__(self):
+        return len(self.pos)
+
+
+def batched_force(func):
+    """
+    Mark a callable as a batched force function.
+
+    A batched force function takes whole-system arrays func(pos, vel, mass), with pos and
+    vel of shape (N, 2) and mass of shape (N,), and returns an (N, 2) force array. Callables
+    with exactly three required positional parameters are detected as batched automatically;
+    use this decorator (or set func.batched) to make the choice explicit.
+    """
+
+    func.batched = True
+    return func
+
+
+def _is_batched_force(func):
+    """Return True if func follows the batched (pos, vel, mass) protocol rather than f(particle)."""
+    explicit = getattr(func, 'batched', None)
+    if explicit is not None:
+        return bool(explicit)
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return False
+    positional = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    required = [p for p in signature.parameters.values()
+                if p.kind in positional and p.default is inspect.Parameter.empty]
+    return len(required) == 3
+
+
 class User_Simulation:
     """
     2D particle simulation engine with force accumulation and time-stepping.
     This class is for advancing particles with user-defined forces (callabale or numeric).
 
+    Force functions may follow either protocol, detected per callable:
+        - per-particle: f(particle) -> [fx, fy]
+        - batched:      f(pos, vel, mass) -> (N, 2) array (see batched_force)
+    Numeric forces may be a single [fx, fy] applied to every particle or an (N, 2) array.
+    All forces are summed into one (N, 2) buffer and integrated in a single vectorized
+    standard Euler update.
+
     Please note that the step() method is incompatible with SK_Field.compute_forces() which 
     returns pre-computed force arrays instead of per-particle force functions.
+
+    With a reordering policy (e.g. Morton_Reordering) the state rows are periodically
+    re-sorted for memory locality. Batched forces and (N, 2) force arrays then follow the
+    current row order; use state.ids or state.by_id() to relate rows to original particles.
+    `particles` keeps the original order.
     """
 
-    def __init__(self, particles, dt):
-        self.particles = np.array(particles)  # Array of Particle objects
+    def __init__(self, particles, dt, profiler=None, reordering=None):
+        """
+        Args:
+            particles: Array of Particle objects or a Particle_State
+            dt: Timestep
+            profiler: Profiler for per-phase timings of force and integration (default: disabled)
+            reordering: Policy with order(pos) -> permutation or None, consulted after every step,
+                e.g. Morton_Reordering (default: None, never reorder)
+        """
+
+        self.state = Particle_State.from_particles(particles)
         self.dt = dt
         self.time = 0.0
+        self.profiler = profiler or NULL_PROFILER
+        self.reordering = reordering
+        self._forces = np.zeros((len(self.state), 2))
+        self._scratch = np.empty((len(self.state), 2))
+        self._batched = weakref.WeakKeyDictionary()   # Protocol detected for each live force function
 
     def step(self, *force_funcs):
         """Advance simulation by one timestep."""
-        for particle in self.particles:
-            forces = []
-            for f in force_funcs:
-                if callable(f):
-                    forces.append(f(particle))
-                else:
-                    forces.append(f)  # Pre-computed array
-            particle.apply_forces(self.dt, *forces)
+        with self.profiler.phase('force'):
+            forces = self._accumulate_forces(force_funcs)
+
+        # Standard Euler (1st-order), same update as Particle._standard_euler
+        with self.profiler.phase('integrate'):
+            scratch = self._scratch
+            np.divide(forces, self.state.mass[:, None], out=scratch)
+            scratch *= self.dt
+            self.state.vel += scratch
+            np.multiply(self.state.vel, self.dt, out=scratch)
+            self.state.pos += scratch
         self.time += self.dt
 
+        if self.reordering is not None:
+            with self.profiler.phase('reorder'):
+                order = self.reordering.order(self.state.pos)
+                if order is not None:
+                    self.state.permute(order)
+
+    def _accumulate_forces(self, force_funcs):
+        """Sum all user forces into the (N, 2) force buffer."""
+        forces = self._forces
+        forces[:] = 0.0
+        for f in force_funcs:
+            if callable(f):
+                try:
+                    batched = self._batched.get(f)
+                    if batched is None:
+                        batched = self._batched[f] = _is_batched_force(f)
+                except TypeError:
+                    batched = _is_batched_force(f)   # Not weak-referenceable, classify every call
+                if batched:
+                    forces += f(self.state.pos, self.state.vel, self.state.mass)
+                else:
+                    for i, particle in enumerate(self.state.row_particles):
+                        forces[i] += f(particle)
+                self.profiler.count('force_evaluations')
+            else:
+                forces += f  # Pre-computed array, [fx, fy] or (N, 2)
+        return forces
+
+    @property
+    def particles(self):
+        """Array of Particle objects viewing the simulation state, in original particle order."""
+        return self.state.particles
+
     def run(self, n_steps: int, *forces):
         """Run simulation for n_steps."""
         for _ in range(n_steps):
@@ -93,6 +318,10 @@ class Particle_Structure:
     """
     Generate initial particle configurations in various geometric structures.
 
+    Positions are generated in bulk and stored in an array-backed Particle_State
+    (`self.state`); Particle objects are only created when `self.particles` is accessed.
+    Pass `self.state` to the simulation engines to avoid creating them at all.
+
     Supported structures:
         - 'circle': Particles distributed on circle perimeter
         - 'diamond': Particles distributed on diamond perimeter
@@ -103,7 +332,20 @@ class Particle_Structure:
         - 'solid_diamond': Particles uniformly distributed inside diamond
     """
 
-    def __init__(self, structure='circle', init_points=None, nParticles=10, particle_vel=(0.0, 0.0), particle_mass=1.0, particle_radius=1.0):
+    def __init__(self, structure='circle', init_points=None, nParticles=10, particle_vel=(0.0, 0.0), particle_mass=1.0, particle_radius=1.0, seed=None, particle_species=0, species_fractions=None):
+        """
+        Args:
+            structure: Structure name (see class docstring)
+            init_points: Structure-specific geometry values
+            nParticles: Number of particles
+            particle_vel, particle_mass, particle_radius: Uniform particle properties
+            seed: Seed or numpy.random.Generator for the random (solid) structures; None draws
+                from the global NumPy RNG, so np.random.seed() keeps runs reproducible (default: None)
+            particle_species: Species id of every particle, or (nParticles,) array of ids (default: 0)
+            species_fractions: Proportion of each species 0, 1, ...; overrides particle_species with
+                a random assignment (see assign_species()) (default: None)
+        """
+
         if init_points is None:
             raise ValueError("init_points cannot be None")
 
@@ -111,47 +353,87 @@ class Particle_Structure:
         self.particle_vel = particle_vel
         self.particle_mass = particle_mass
         self.particle_radius = particle_radius
+        self.rng = np.random if seed is None else np.random.default_rng(seed)
 
         init_points = np.array(init_points).flatten()
 
         if structure == 'circle':
             if len(init_points) != 3:
                 raise ValueError("Circle structure requires 3 values: [center_x, center_y, radius]")
-            self.particles = self.gen_circle(init_points, nParticles)
+            self.state = self.gen_circle(init_points, nParticles)
         elif structure == 'diamond':
             if len(init_points) != 4:
                 raise ValueError("Diamond structure requires 4 values: [center_x, center_y, x_length, y_length]")
-            self.particles = self.gen_diamond(init_points, nParticles)
+            self.state = self.gen_diamond(init_points, nParticles)
         elif structure == 'heart':
             raise NotImplementedError('Heart structure not implemented yet')
         elif structure == 'line':
             if len(init_points) != 4:
                 raise ValueError("Line structure requires 4 values: [start_x, start_y, end_x, end_y]")
-            self.particles = self.gen_line(init_points, nParticles)
+            self.state = self.gen_line(init_points, nParticles)
         elif structure == 'rectangle':
             if len(init_points) != 4:
                 raise ValueError("Rectangle structure requires 4 values: [bottom_left_x, bottom_left_y, x_length, y_length]")
-            self.particles = self.gen_rectangle(init_points, nParticles)
+            self.state = self.gen_rectangle(init_points, nParticles)
         elif structure == 'solid_circle':
             if len(init_points) != 3:
                 raise ValueError("Solid circle structure requires 3 values: [center_x, center_y, radius]")
-            self.particles = self.gen_solid_circle(init_points, nParticles)
+            self.state = self.gen_solid_circle(init_points, nParticles)
         elif structure == 'solid_diamond':
             if len(init_points) != 4:
                 raise ValueError("Solid diamond structure requires 4 values: [center_x, center_y, x_length, y_length]")
-            self.particles = self.gen_solid_diamond(init_points, nParticles)
+            self.state = self.gen_solid_diamond(init_points, nParticles)
         else:
             raise ValueError(f"Unknown structure: {structure}")
 
+        if species_fractions is not None:
+            self.assign_species(species_fractions)
+        else:
+            self.state.species[:] = particle_species
+
+    @property
+    def particles(self):
+        """Array of Particle objects (created lazily from self.state)."""
+        return self.state.particles
+
+    @particles.setter
+    def particles(self, particles):
+        self.state = Particle_State.from_particles(particles)
+
+    def assign_species(self, fractions):
+        """
+        Randomly assign species ids in the given proportions.
+
+        Counts are rounded cumulatively so they sum to the number of particles; the
+        assignment is shuffled with the structure's random generator (or the global NumPy RNG).
+
+        Args:
+            fractions: Relative proportion of species 0, 1, ... (need not be normalized; at
+                least one must be positive and none negative)
+        """
+
+        fractions = np.asarray(fractions, dtype=float)
+        if fractions.ndim != 1 or not np.all(np.isfinite(fractions)) or np.any(fractions < 0):
+            raise ValueError(f"Species fractions must be finite and non-negative, got {fractions}")
+        if fractions.sum() == 0:
+            raise ValueError("At least one species fraction must be positive")
+        n = len(self.state)
+        bounds = np.floor(np.cumsum(fractions) / fractions.sum() * n + 0.5).astype(int)
+        species = np.repeat(np.arange(len(fractions)), np.diff(bounds, prepend=0))
+        self.rng.shuffle(species)
+        self.state.species[:] = species
+
+    def _make_state(self, x, y):
+        """Wrap generated coordinates in a Particle_State with the uniform structure properties."""
+        return Particle_State(np.column_stack([x, y]), self.particle_vel, self.particle_mass, self.particle_radius)
+
     def gen_circle(self, init_points, nParticles):
         """Generate particles uniformly distributed on a circle."""
         center_x, center_y, circle_radius = init_points
         φ = np.linspace(0, 2*np.pi, nParticles, endpoint=False)
         x = center_x + circle_radius*np.cos(φ)
         y = center_y + circle_radius*np.sin(φ)
-        particles = np.array([Particle(position=[x[i], y[i]], velocity=self.particle_vel, mass=self.particle_mass, radius=self.particle_radius) for i in range(nParticles)])
-        #return np.array([particle.pos for particle in particles])   # Return positions only
-        return particles
+        return self._make_state(x, y)
 
     def gen_diamond(self, init_points, nParticles, tilt=None):
         """
@@ -206,25 +488,14 @@ class Particle_Structure:
         x = np.concatenate([x_tr, x_rb, x_bl, x_lt])
         y = np.concatenate([y_tr, y_rb, y_bl, y_lt])
 
-        particles = np.array([
-            Particle(
-                position=[x[i], y[i]], 
-                velocity=self.particle_vel, 
-                mass=self.particle_mass, 
-                radius=self.particle_radius
-            ) for i in range(nParticles)
-        ])
-
-        return particles
+        return self._make_state(x, y)
 
     def gen_line(self, init_points, nParticles):
         """Generate particles uniformly distributed along a line segment."""
         start_x, start_y, end_x, end_y = init_points
         x = np.linspace(start_x, end_x, nParticles)
         y = np.linspace(start_y, end_y, nParticles)
-        particles = np.array([Particle(position=[x[i], y[i]], velocity=self.particle_vel, mass=self.particle_mass, radius=self.particle_radius) for i in range(nParticles)])
-        #return np.array([particle.pos for particle in particles])   # Return positions only
-        return particles
+        return self._make_state(x, y)
 
     def gen_rectangle(self, init_points, nParticles, tilt=None):
         """Generate particles uniformly distributed on rectangle perimeter."""
@@ -254,8 +525,7 @@ class Particle_Structure:
         x = np.concatenate([x_bottom, x_right, x_top, x_left])
         y = np.concatenate([y_bottom, y_right, y_top, y_left])
 
-        particles = np.array([Particle(position=[x[i], y[i]], velocity=self.particle_vel, mass=self.particle_mass, radius=self.particle_radius) for i in range(nParticles)])
-        return particles
+        return self._make_state(x, y)
 
     def gen_solid_circle(self, init_points, nParticles):
         """
@@ -273,28 +543,21 @@ class Particle_Structure:
         # Uniform sampling in polar coordinates
         # r ~ sqrt(U[0,1]) for uniform area density
         # φ ~ U[0, 2π]
-        r = radius * np.sqrt(np.random.uniform(0, 1, nParticles))
-        φ = np.random.uniform(0, 2*np.pi, nParticles)
+        r = radius * np.sqrt(self.rng.uniform(0, 1, nParticles))
+        φ = self.rng.uniform(0, 2*np.pi, nParticles)
 
         x = center_x + r * np.cos(φ)
         y = center_y + r * np.sin(φ)
 
-        particles = np.array([
-            Particle(
-                position=[x[i], y[i]], 
-                velocity=self.particle_vel, 
-                mass=self.particle_mass, 
-                radius=self.particle_radius
-            ) for i in range(nParticles)
-        ])
-
-        return particles
+        return self._make_state(x, y)
 
     def gen_solid_diamond(self, init_points, nParticles, tilt=None):
         """
         Generate particles uniformly distributed inside a solid diamond.
 
-        Uses rejection sampling within bounding box.
+        Uses exact inverse-transform sampling: the diamond |Δx|/a + |Δy|/b ≤ 1 is the image
+        of the unit square under the affine map Δx = a(u + v - 1), Δy = b(u - v), whose
+        constant Jacobian maps uniform (u, v) to uniform points inside the diamond.
 
         Args:
             init_points: [center_x, center_y, x_length, y_length]
@@ -304,21 +567,10 @@ class Particle_Structure:
 
         center_x, center_y, x_length, y_length = init_points
 
-        particles = []
-        while len(particles) < nParticles:
-            # Sample from bounding box
-            x = np.random.uniform(center_x - x_length/2, center_x + x_length/2)
-            y = np.random.uniform(center_y - y_length/2, center_y + y_length/2)
-
-            # Check if inside diamond: |Δx|/half_width + |Δy|/half_height ≤ 1
-            if abs(x - center_x)/(x_length/2) + abs(y - center_y)/(y_length/2) <= 1:
-                particles.append(
-                    Particle(
-                        position=[x, y], 
-                        velocity=self.particle_vel, 
-                        mass=self.particle_mass, 
-                        radius=self.particle_radius
-                    )
-                )
-
-        return np.array(particles)
\ No newline at end of file
+        u = self.rng.uniform(0, 1, nParticles)
+        v = self.rng.uniform(0, 1, nParticles)
+
+        x = center_x + (x_length/2) * (u + v - 1)
+        y = center_y + (y_length/2) * (u - v)
+
+        return self._make_state(x, y)
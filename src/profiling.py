@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class _Null_Phase:
+    """Reusable no-op context manager returned by disabled profilers."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_PHASE = _Null_Phase()
+
+
+class Null_Profiler:
+    """
+    Disabled profiler.
+
+    Every method is a no-op and phase() returns one shared context manager, so engines
+    can keep their instrumentation calls in place at effectively zero cost.
+    """
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def add_hook(self, hook):
+        raise RuntimeError("Cannot add hooks to a disabled profiler; use Profiler() instead")
+
+
+NULL_PROFILER = Null_Profiler()
+
+
+class _Phase:
+    """Context manager timing one phase of a Profiler."""
+
+    __slots__ = ('profiler', 'name', 'start', 'blocks', 'traced')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.track_allocations:
+            self.blocks = sys.getallocatedblocks()
+            self.traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        prof = self.profiler
+        duration = end - self.start
+        prof.phase_time[self.name] = prof.phase_time.get(self.name, 0.0) + duration
+        prof.phase_calls[self.name] = prof.phase_calls.get(self.name, 0) + 1
+
+        if prof.track_allocations:
+            blocks = sys.getallocatedblocks() - self.blocks
+            prof.phase_blocks[self.name] = prof.phase_blocks.get(self.name, 0) + blocks
+            if tracemalloc.is_tracing():
+                traced = tracemalloc.get_traced_memory()[0] - self.traced
+                prof.phase_bytes[self.name] = prof.phase_bytes.get(self.name, 0) + traced
+
+        for hook in prof.hooks:
+            hook(self.name, self.start, duration)
+        return False
+
+
+class Profiler:
+    """
+    Low-overhead per-phase profiler for the simulation engines.
+
+    Accumulates wall time and call counts per named phase, plus free-form counters
+    (pair interactions, force evaluations, ...). With track_allocations=True each phase
+    also records the net change in allocated Python memory blocks and, while tracemalloc
+    is tracing, net traced bytes.
+
+    Hooks are callables hook(name, start, duration) invoked at the end of every phase,
+    e.g. Chrome_Trace_Exporter or Log_Exporter. Engines accept a profiler argument and
+    default to NULL_PROFILER, which costs effectively nothing.
+
+    Example:
+        prof = Profiler()
+        field = SK_Field(G=10.0, profiler=prof)
+        sim = Verlet_Simulation(particles, 1e-5, field, profiler=prof)
+        sim.run(1000)
+        print(prof.summary())
+    """
+
+    enabled = True
+
+    def __init__(self, track_allocations=False, hooks=()):
+        """
+        Args:
+            track_allocations: Record net allocations per phase (default: False)
+            hooks: Callables hook(name, start, duration) called after each phase
+        """
+
+        self.track_allocations = track_allocations
+        self.hooks = list(hooks)
+        self.reset()
+
+    def reset(self):
+        """Clear all accumulated timings and counters."""
+        self.phase_time = {}
+        self.phase_calls = {}
+        self.phase_blocks = {}
+        self.phase_bytes = {}
+        self.counters = {}
+
+    def phase(self, name):
+        """Context manager timing a named phase."""
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """Increment a named counter by n."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_hook(self, hook):
+        """Register a callable hook(name, start, duration)."""
+        self.hooks.append(hook)
+
+    def report(self):
+        """Return accumulated timings, counts and allocations as a plain dict."""
+        phases = {}
+        for name, total in self.phase_time.items():
+            calls = self.phase_calls[name]
+            phases[name] = {'total_seconds': total, 'calls': calls, 'mean_seconds': total / calls}
+            if name in self.phase_blocks:
+                phases[name]['net_blocks'] = self.phase_blocks[name]
+            if name in self.phase_bytes:
+                phases[name]['net_bytes'] = self.phase_bytes[name]
+        return {'phases': phases, 'counters': dict(self.counters)}
+
+    def summary(self):
+        """Human-readable table of phases (slowest first) and counters."""
+        lines = [f"{'phase':24s} {'calls':>10s} {'total [s]':>12s} {'mean [µs]':>12s}"]
+        for name, total in sorted(self.phase_time.items(), key=lambda item: -item[1]):
+            calls = self.phase_calls[name]
+            lines.append(f"{name:24s} {calls:10d} {total:12.4f} {1e6 * total / calls:12.2f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name:24s} {value:>10d}")
+        return '\n'.join(lines)
+
+
+class Chrome_Trace_Exporter:
+    """
+    Profiler hook collecting phases as Chrome trace events.
+
+    The written JSON file opens in chrome://tracing or Perfetto. Nested phases
+    (e.g. compute_forces inside a Verlet force phase) show as stacked slices.
+    """
+
+    def __init__(self, path=None, max_events=1_000_000):
+        """
+        Args:
+            path: Default output path for write() (default: None)
+            max_events: Stop recording after this many events to bound memory
+        """
+
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self._pid = os.getpid()
+
+    def __call__(self, name, start, duration):
+        if len(self.events) < self.max_events:
+            self.events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': duration * 1e6,
+                'pid': self._pid,
+                'tid': threading.get_ident(),
+            })
+
+    def write(self, path=None, profiler=None):
+        """
+        Write collected events to path as Chrome trace JSON.
+
+        Args:
+            path: Output file (default: path given at construction)
+            profiler: If given, its counters are appended as counter events
+        """
+
+        events = list(self.events)
+        if profiler is not None and events:
+            ts = events[-1]['ts'] + events[-1]['dur']
+            for name, value in profiler.counters.items():
+                events.append({'name': name, 'ph': 'C', 'ts': ts, 'pid': self._pid, 'args': {name: value}})
+        with open(path or self.path, 'w') as fh:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh)
+
+
+class Log_Exporter:
+    """
+    Profiler hook writing one line per phase to a logger or print-like callable.
+
+    Use every > 1 to log only each n-th event of each phase.
+    """
+
+    def __init__(self, log=print, every=1):
+        """
+        Args:
+            log: logging.Logger (uses .info) or callable taking a string (default: print)
+            every: Log every n-th event per phase (default: 1)
+        """
+
+        self.log = getattr(log, 'info', log)
+        self.every = every
+        self._seen = {}
+
+    def __call__(self, name, start, duration):
+        seen = self._seen.get(name, 0) + 1
+        self._seen[name] = seen
+        if seen % self.every == 0:
+            self.log(f"[profile] {name}: {1e6 * duration:.1f} µs")
@@ -5,11 +5,23 @@ __author__ = "Kamyar Modjtahedzadeh"
 
 try:
     # If imported from ~/workspace
+    from src.autotune import *
+    from src.domain_decomposition import *
     from src.fields import *
     from src.particles_and_structures import *
+    from src.parareal import *
+    from src.profiling import *
+    from src.rendering import *
+    from src.spatial_order import *
     from src.verlet_simulation import *
 except ImportError:
     # If imported from ~/workspace/src
+    from autotune import *
+    from domain_decomposition import *
     from fields import *
     from particles_and_structures import *
+    from parareal import *
+    from profiling import *
+    from rendering import *
+    from spatial_order import *
     from verlet_simulation import *
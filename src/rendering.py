@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class Snapshot:
+    """Positions (N, 2) and species ids (N,) of one frame at simulation time `time`."""
+
+    __slots__ = ('index', 'time', 'pos', 'species')
+
+    def __init__(self, index, time, pos, species=None):
+        self.index = index
+        self.time = time
+        self.pos = pos
+        self.species = species
+
+
+class Frame_Renderer:
+    """
+    Draws one Snapshot per figure and saves it with matplotlib's non-interactive Agg backend.
+
+    Instances are sent once to every render worker, so they must be picklable. Subclasses
+    customize the plot by overriding draw(). Frames keep a fixed figure size and axis
+    limits, so image sequences can be encoded into videos as they are (e.g. with ffmpeg).
+    """
+
+    def __init__(self, directory, format='png', limits=None, dpi=100, figsize=(6.0, 6.0),
+                 marker_size=4.0, prefix='frame'):
+        """
+        Args:
+            directory: Output directory (created if missing)
+            format: Image format understood by matplotlib, e.g. 'png' or 'pdf' (default: 'png')
+            limits: (xmin, xmax, ymin, ymax) of every frame (default: from the first frame, see fit())
+            dpi: Resolution of raster formats (default: 100)
+            figsize: Figure size in inches (default: (6, 6))
+            marker_size: Scatter marker size in points² (default: 4)
+            prefix: File name prefix; frames are named {prefix}_{index:05d}.{format} (default: 'frame')
+        """
+
+        self.directory = directory
+        self.format = format
+        self.limits = limits
+        self.dpi = dpi
+        self.figsize = figsize
+        self.marker_size = marker_size
+        self.prefix = prefix
+
+    def path(self, index):
+        """File path of frame `index`."""
+        return os.path.join(self.directory, f"{self.prefix}_{index:05d}.{self.format}")
+
+    def fit(self, snapshot, margin=0.5):
+        """Set square limits enclosing the snapshot, padded by `margin` × its half-extent."""
+        lo, hi = snapshot.pos.min(axis=0), snapshot.pos.max(axis=0)
+        center = 0.5 * (lo + hi)
+        half = max(0.5 * np.max(hi - lo), np.finfo(float).eps) * (1.0 + margin)
+        self.limits = (center[0] - half, center[0] + half, center[1] - half, center[1] + half)
+
+    def draw(self, ax, snapshot):
+        """Plot the snapshot onto the axes (species in distinct colours)."""
+        if snapshot.species is None:
+            colors = dict(c='C0')
+        else:
+            colors = dict(c=snapshot.species % 10, cmap='tab10', vmin=0, vmax=9)
+        ax.scatter(snapshot.pos[:, 0], snapshot.pos[:, 1], s=self.marker_size, linewidths=0, **colors)
+        ax.set_title(f'$t={snapshot.time:.5f}$')
+
+    def render(self, snapshot):
+        """Draw and save one frame; returns its path."""
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=self.figsize)
+        self.draw(ax, snapshot)
+        ax.grid(True)
+        ax.set_aspect('equal')
+        if self.limits is not None:
+            ax.set_xlim(self.limits[0], self.limits[1])
+            ax.set_ylim(self.limits[2], self.limits[3])
+        ax.set_xlabel(r'$x$-axis', fontsize=15)
+        ax.set_ylabel(r'$y$-axis', fontsize=15)
+        path = self.path(snapshot.index)
+        fig.savefig(path, dpi=self.dpi)
+        plt.close(fig)
+        return path
+
+
+# Per-process renderer, sent once to each pool worker
+_WORKER = {}
+
+
+def _init_worker(renderer, niceness):
+    import matplotlib
+    matplotlib.use('Agg')
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)   # Renderers yield to the simulation when cores are oversubscribed
+    _WORKER['renderer'] = renderer
+
+
+def _render(snapshot):
+    return _WORKER['renderer'].render(snapshot)
+
+
+class Render_Pipeline:
+    """
+    Renders simulation snapshots to image files on a process pool, off the integration loop.
+
+    The producer (a running simulation via run(), a stored trajectory via
+    submit_trajectory(), or any code calling submit()) only copies the state of every
+    `every`-th snapshot into a bounded queue. A dispatcher thread feeds queued snapshots to
+    `processes` worker processes running the Frame_Renderer, with at most two frames in
+    flight per worker. When renderers fall behind and the queue is full, submit() either
+    blocks until a slot frees up (backpressure='block', no frames lost) or discards the
+    snapshot (backpressure='drop', the simulation never waits). Time spent blocked is
+    reported as 'blocked_time'.
+
+    Frames are numbered in submission order. Rendering errors are raised by close().
+    """
+
+    def __init__(self, renderer, processes=None, every=1, queue_size=64, backpressure='block', niceness=19):
+        """
+        Args:
+            renderer: Frame_Renderer (or picklable subclass) drawing and saving the frames
+            processes: Render worker processes (default: os.cpu_count())
+            every: Decimation; only every `every`-th submitted snapshot is rendered (default: 1)
+            queue_size: Snapshots buffered before backpressure applies (default: 64)
+            backpressure: 'block' or 'drop' when the queue is full (default: 'block')
+            niceness: Scheduling niceness added to the workers, 0 to disable (default: 19)
+        """
+
+        if backpressure not in ('block', 'drop'):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        self.renderer = renderer
+        self.processes = processes or os.cpu_count() or 1
+        self.every = max(1, int(every))
+        self.backpressure = backpressure
+        self.niceness = niceness
+        self._queue = queue.Queue(queue_size)
+        self._pool = None
+        self._dispatcher = None
+        self._futures = []
+        self._frames = []
+        self._offered = 0
+        self._start = None
+        self.stats = {'submitted': 0, 'decimated': 0, 'dropped': 0, 'blocked_time': 0.0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc_type is None)
+        return False
+
+    def _open(self, snapshot):
+        """Start the pool and dispatcher on the first accepted snapshot."""
+        os.makedirs(self.renderer.directory, exist_ok=True)
+        if self.renderer.limits is None:
+            self.renderer.fit(snapshot)   # One set of limits for every frame
+        self._start = time.perf_counter()
+        self._pool = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                         initargs=(self.renderer, self.niceness))
+        self._pool.submit(int)   # Start the workers from this thread, before the dispatcher exists
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        in_flight = threading.Semaphore(2 * self.processes)
+        while True:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                return
+            in_flight.acquire()
+            future = self._pool.submit(_render, snapshot)
+            future.add_done_callback(lambda _: in_flight.release())
+            self._futures.append(future)
+
+    def submit(self, t, pos, species=None):
+        """
+        Offer one snapshot; returns True if it was queued for rendering.
+
+        Args:
+            t: Simulation time of the snapshot
+            pos: (N, 2) positions (copied unless the snapshot is decimated)
+            species: Optional (N,) species ids used for colouring
+        """
+
+        self._offered += 1
+        if (self._offered - 1) % self.every:
+            self.stats['decimated'] += 1
+            return False
+
+        snapshot = Snapshot(self.stats['submitted'], float(t), np.array(pos, dtype=float),
+                            None if species is None else np.array(species))
+        if self._pool is None:
+            self._open(snapshot)
+        try:
+            self._queue.put_nowait(snapshot)
+        except queue.Full:
+            if self.backpressure == 'drop':
+                self.stats['dropped'] += 1
+                return False
+            start = time.perf_counter()
+            self._queue.put(snapshot)
+            self.stats['blocked_time'] += time.perf_counter() - start
+        self.stats['submitted'] += 1
+        return True
+
+    def run(self, sim, n_steps, *forces, interval=1):
+        """
+        Advance a simulation by n_steps, submitting its state every `interval` steps.
+
+        Works with any engine exposing run(n_steps, ...), time and state (Verlet_Simulation,
+        User_Simulation with its force functions, Parareal_Simulation, ...). The initial
+        state is submitted first. Forces are passed on to sim.run() as for User_Simulation,
+        so `interval` is keyword-only.
+        """
+
+        self.submit(sim.time, sim.state.pos, sim.state.species)
+        done = 0
+        while done < n_steps:
+            steps = min(interval, n_steps - done)
+            sim.run(steps, *forces)
+            done += steps
+            self.submit(sim.time, sim.state.pos, sim.state.species)
+
+    def submit_trajectory(self, positions, times=None, species=None):
+        """
+        Submit every frame of a stored trajectory.
+
+        Args:
+            positions: (T, N, 2) array, or a .npy file (memory-mapped) of one, or a .npz file
+                with 'pos' and optionally 'time' and 'species' arrays
+            times: (T,) frame times (default: frame numbers)
+            species: (N,) species ids shared by every frame
+        """
+
+        if isinstance(positions, str):
+            if positions.endswith('.npz'):
+                stored = np.load(positions)
+                positions = stored['pos']
+                times = stored['time'] if times is None and 'time' in stored else times
+                species = stored['species'] if species is None and 'species' in stored else species
+            else:
+                positions = np.load(positions, mmap_mode='r')
+        times = np.arange(len(positions)) if times is None else times
+        for t, pos in zip(times, positions):
+            self.submit(t, pos, species)
+
+    def close(self, raise_errors=True):
+        """
+        Wait for every queued frame and shut the workers down.
+
+        Returns:
+            Report dict with 'frames' (paths in frame order), 'submitted', 'decimated',
+            'dropped', 'blocked_time' (seconds submit() waited on a full queue) and
+            'wall_time' (first accepted snapshot to the last rendered frame)
+        """
+
+        error = None
+        if self._pool is not None:
+            self._queue.put(None)
+            self._dispatcher.join()
+            for future in self._futures:
+                try:
+                    self._frames.append(future.result())
+                except Exception as exc:
+                    error = error or exc
+            self._pool.shutdown()
+            self.stats['wall_time'] = time.perf_counter() - self._start
+            self._pool = None
+            self._futures = []
+        if error is not None and raise_errors:
+            raise RuntimeError(f"Frame rendering failed: {error!r}") from error
+        return dict(self.stats, frames=list(self._frames))
+
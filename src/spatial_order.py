@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+import numpy as np
+
+
+def _spread_bits(v):
+    """Insert a zero bit between each of the low 32 bits of v (uint64)."""
+    v = v & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def morton_keys(pos, bits=16):
+    """
+    Morton (Z-order) keys of 2D positions.
+
+    Positions are quantized onto a 2^bits × 2^bits grid spanning their bounding box and
+    the x and y cell indices are bit-interleaved, so particles close in space get close
+    keys. Non-finite coordinates are mapped to the edge of the grid.
+
+    Args:
+        pos: (N, 2) array of positions
+        bits: Grid resolution per axis, at most 32 (default: 16)
+
+    Returns:
+        (N,) uint64 array of keys
+    """
+
+    if not 1 <= bits <= 32:
+        raise ValueError("bits must be between 1 and 32")
+
+    pos = np.asarray(pos, dtype=float)
+    if len(pos) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    finite = np.isfinite(pos).all(axis=1)
+    if not finite.any():
+        return np.zeros(len(pos), dtype=np.uint64)
+    lo = pos[finite].min(axis=0)
+    span = pos[finite].max(axis=0) - lo
+    span[span == 0.0] = 1.0
+
+    cells = (1 << bits) - 1
+    scaled = np.nan_to_num((pos - lo) / span * cells, nan=cells, posinf=cells, neginf=0.0)
+    grid = np.clip(scaled, 0, cells).astype(np.uint64)
+    return _spread_bits(grid[:, 0]) | (_spread_bits(grid[:, 1]) << np.uint64(1))
+
+
+def morton_order(pos, bits=16):
+    """Stable permutation sorting positions along the Morton curve."""
+    return np.argsort(morton_keys(pos, bits), kind='stable')
+
+
+def morton_disorder(pos, bits=16):
+    """
+    Fraction of consecutive particles whose Morton keys are out of order.
+
+    0 right after a Morton sort, about 0.5 for a randomly shuffled array.
+    """
+
+    keys = morton_keys(pos, bits)
+    if len(keys) < 2:
+        return 0.0
+    return float(np.count_nonzero(keys[1:] < keys[:-1])) / (len(keys) - 1)
+
+
+class Morton_Reordering:
+    """
+    Policy deciding when a simulation engine re-sorts its particle state along the Morton curve.
+
+    Sorting keeps particles that are close in space close in memory, which keeps tiled
+    kernels, tree builds and neighbour searches cache-friendly as the system evolves.
+    A reorder happens every `every` steps, or, with disorder_threshold set, whenever
+    morton_disorder() measured every check_interval steps exceeds the threshold.
+
+    The engines apply the permutation with Particle_State.permute(), which keeps
+    Particle_State.ids so results can still be reported by original particle index.
+    """
+
+    def __init__(self, every=None, disorder_threshold=None, check_interval=100, bits=16):
+        """
+        Args:
+            every: Reorder unconditionally every this many steps (default: None)
+            disorder_threshold: Reorder when morton_disorder() exceeds this (default: None)
+            check_interval: Steps between disorder measurements (default: 100)
+            bits: Morton grid resolution per axis (default: 16)
+        """
+
+        if every is None and disorder_threshold is None:
+            raise ValueError("Morton_Reordering needs every and/or disorder_threshold")
+
+        self.every = every
+        self.disorder_threshold = disorder_threshold
+        self.check_interval = check_interval
+        self.bits = bits
+        self.reorders = 0
+        self._since_reorder = 0
+
+    def order(self, pos):
+        """
+        Called by an engine once per step; returns a permutation to apply, or None.
+
+        Args:
+            pos: (N, 2) current positions
+        """
+
+        self._since_reorder += 1
+        due = self.every is not None and self._since_reorder >= self.every
+        if not due and self.disorder_threshold is not None and self._since_reorder % self.check_interval == 0:
+            due = morton_disorder(pos, self.bits) > self.disorder_threshold
+        if not due:
+            return None
+
+        self._since_reorder = 0
+        self.reorders += 1
+        return morton_order(pos, self.bits)
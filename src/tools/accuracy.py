@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+"""
+Accuracy-versus-Speed Validation Harness for Approximate Force Solvers
+
+Runs candidate field/integrator configurations against the exact SK_Field double sum on
+standard scenarios and measures what each configuration trades for its speed:
+
+    - per-particle relative force error |F - F_ref| / |F_ref| (initial and final reference states)
+    - energy deviation: max |E(t) - E_ref(t)| / |E_ref(0)|, with E = kinetic + exact pair
+      potential, i.e. the deviation from the reference trajectory's energy rather than a drift
+      from E(0), so time-varying scenarios (whose energy is not conserved) are covered too
+    - R_avg(t) divergence: max |R_avg(t) - R_avg,ref(t)| / R_avg,ref(0)
+    - wall time of the candidate run and its speedup over the reference run
+
+Scenarios:
+    - 'circle_collapse': 100-particle ring collapsing under softened gravity
+    - 'breathing_ring':  100-particle ring at λ = 0.843 with ζ(t) modulated repulsion
+    - 'solid_cloud':     solid_circle cloud collapsing under softened gravity
+    - 'repulsive_cloud': solid_circle cloud under gravity and an r^-1.5 repulsion, the one
+                         scenario whose kernel needs pow per pair (and is changed by tabulation)
+
+A Candidate builds its field from the scenario parameters (field_factory), so approximate
+solvers with an opening angle, expansion order, cutoff or reduced precision plug in as
+factories returning any object with compute_forces(state, time); dt_factor scales the
+scenario timestep (records report the dt actually integrated). Results are printed as a per-scenario Pareto table (wall time vs.
+error), and cheapest_candidates() picks the fastest configuration meeting given tolerances.
+
+Usage (from the repository root):
+    python -m src.tools.accuracy --dt-factors 1 2 4 8 --force-tol 1e-6 --rdiv-tol 1e-3
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import src.pyparticlesim as pps
+
+METRICS = ('force_error_max', 'force_error_median', 'energy_deviation', 'r_avg_divergence')
+
+
+def _circle_collapse():
+    state = pps.Particle_Structure('circle', [0.0, 0.0, 1.0], 100).state
+    return state, dict(G=10.0, grav_softening=0.05), 1e-5, 0.02
+
+
+def _breathing_ring():
+    lam, G = 0.843, 10.0
+    state = pps.Particle_Structure('circle', [0.0, 0.0, 1.0], 100).state
+    params = dict(G=G, grav_softening=0.05, k_zeta=lam * G, zeta_softening=0.05, omega_zeta=300.0)
+    return state, params, 1e-5, 2 * (2 * np.pi / 300.0)   # Two modulation cycles
+
+
+def _solid_cloud():
+    state = pps.Particle_Structure('solid_circle', [0.0, 0.0, 1.0], 400, seed=0).state
+    return state, dict(G=10.0, grav_softening=0.05), 1e-5, 0.01
+
+
+def _repulsive_cloud():
+    state = pps.Particle_Structure('solid_circle', [0.0, 0.0, 1.0], 200, seed=0).state
+    params = dict(G=10.0, grav_softening=0.05, k_repulsive=2.0, repulsive_softening=0.05, repulsive_exponent=1.5)
+    return state, params, 1e-5, 0.01
+
+
+# Scenario name -> setup() returning (initial Particle_State, SK_Field params, dt, duration)
+SCENARIOS = {
+    'circle_collapse': _circle_collapse,
+    'breathing_ring': _breathing_ring,
+    'solid_cloud': _solid_cloud,
+    'repulsive_cloud': _repulsive_cloud,
+}
+
+
+class Candidate:
+    """
+    One field/integrator configuration under test.
+
+    The reference configuration is Candidate('exact'): SK_Field with the scenario
+    parameters and the scenario timestep.
+    """
+
+    def __init__(self, name, field_factory=None, dt_factor=1.0, **field_options):
+        """
+        Args:
+            name: Label used in the results table
+            field_factory: Callable(params) -> field with compute_forces(state, time)
+                (default: SK_Field(**field_options, **params))
+            dt_factor: Multiplier of the scenario timestep (default: 1.0)
+            **field_options: Extra SK_Field keyword arguments, e.g. tabulation_tolerance
+        """
+
+        self.name = name
+        self.field_factory = field_factory
+        self.dt_factor = dt_factor
+        self.field_options = field_options
+
+    def make_field(self, params):
+        if self.field_factory is not None:
+            return self.field_factory(params)
+        return pps.SK_Field(**self.field_options, **params)
+
+
+def _energy(field, state, time):
+    kinetic = 0.5 * np.sum(state.mass * np.sum(state.vel**2, axis=1))
+    return kinetic + field.compute_potential_energy(state, time)
+
+
+def _r_avg(state):
+    return np.mean(np.linalg.norm(state.pos, axis=1))
+
+
+def run_trajectory(state, field, dt, duration, n_samples, reference_field):
+    """
+    Integrate a copy of state with velocity Verlet and sample R_avg and energy.
+
+    Samples are taken at n_samples + 1 equally spaced times in [0, duration]; dt is
+    rounded so that every sample interval holds a whole number of steps.
+
+    Returns:
+        Dict with 'times', 'r_avg', 'energy', 'final_state', 'dt' (the rounded timestep
+        actually integrated) and 'wall_time' (integration only)
+    """
+
+    interval = duration / n_samples
+    steps_per_sample = max(1, int(round(interval / dt)))
+    dt = interval / steps_per_sample
+    sim = pps.Verlet_Simulation(
+        pps.Particle_State(state.pos, state.vel, state.mass, state.radius, state.species),
+        dt, field,
+    )
+
+    times, r_avg, energy = [0.0], [_r_avg(sim.state)], [_energy(reference_field, sim.state, 0.0)]
+    wall_time = 0.0
+    for _ in range(n_samples):
+        start = time.perf_counter()
+        sim.run(steps_per_sample)
+        wall_time += time.perf_counter() - start
+        times.append(sim.time)
+        r_avg.append(_r_avg(sim.state))
+        energy.append(_energy(reference_field, sim.state, sim.time))
+
+    return {
+        'times': np.array(times),
+        'r_avg': np.array(r_avg),
+        'energy': np.array(energy),
+        'final_state': sim.state,
+        'dt': dt,
+        'wall_time': wall_time,
+    }
+
+
+def force_errors(field, reference_field, state, time=0.0):
+    """Per-particle relative force error |F - F_ref| / |F_ref| on one state."""
+    reference = reference_field.compute_forces(state, time)
+    forces = field.compute_forces(state, time)
+    norm = np.linalg.norm(reference, axis=1)
+    floor = max(np.finfo(float).tiny, 1e-12 * norm.max(initial=0.0))
+    return np.linalg.norm(forces - reference, axis=1) / np.maximum(norm, floor)
+
+
+def _timed_trajectory(state, field, dt, duration, n_samples, reference_field, repeats):
+    """run_trajectory() repeated; keeps the first run's samples and the minimum wall time."""
+    run = run_trajectory(state, field, dt, duration, n_samples, reference_field)
+    for _ in range(repeats - 1):
+        again = run_trajectory(state, field, dt, duration, n_samples, reference_field)
+        run['wall_time'] = min(run['wall_time'], again['wall_time'])
+    return run
+
+
+def evaluate_scenario(name, candidates, n_samples=20, duration_scale=1.0, repeats=1, verbose=True):
+    """
+    Run the reference and every candidate on one scenario.
+
+    Wall times are the minimum over repeats runs of each configuration.
+
+    Returns:
+        List of result records, one per candidate
+    """
+
+    state, params, dt, duration = SCENARIOS[name]()
+    duration *= duration_scale
+    reference_field = pps.SK_Field(**params)
+    reference = _timed_trajectory(state, reference_field, dt, duration, n_samples, reference_field, repeats)
+    e_scale = max(abs(reference['energy'][0]), np.finfo(float).tiny)
+
+    records = []
+    for candidate in candidates:
+        field = candidate.make_field(params)
+        errors = np.concatenate([
+            force_errors(field, reference_field, state, 0.0),
+            force_errors(field, reference_field, reference['final_state'], reference['times'][-1]),
+        ])
+        run = _timed_trajectory(state, field, dt * candidate.dt_factor, duration, n_samples, reference_field, repeats)
+        record = {
+            'scenario': name,
+            'candidate': candidate.name,
+            'N': len(state),
+            'dt': run['dt'],
+            'force_error_max': float(errors.max()),
+            'force_error_median': float(np.median(errors)),
+            'energy_deviation': float(np.max(np.abs(run['energy'] - reference['energy'])) / e_scale),
+            'r_avg_divergence': float(np.max(np.abs(run['r_avg'] - reference['r_avg'])) / reference['r_avg'][0]),
+            'wall_time': run['wall_time'],
+            'speedup': reference['wall_time'] / run['wall_time'],
+        }
+        records.append(record)
+        if verbose:
+            print(f"{name:16s} {candidate.name:24s} force err {record['force_error_max']:.2e}  "
+                  f"energy {record['energy_deviation']:.2e}  R_avg {record['r_avg_divergence']:.2e}  "
+                  f"{record['wall_time']:.3f} s")
+    return records
+
+
+def run_harness(candidates, scenarios=None, n_samples=20, duration_scale=1.0, repeats=1, verbose=True):
+    """
+    Evaluate candidates on the given scenarios (default: all).
+
+    Args:
+        candidates: List of Candidate
+        scenarios: Scenario names (default: all of SCENARIOS)
+        n_samples: Trajectory samples used for the energy and R_avg comparisons
+        duration_scale: Multiplier of every scenario's simulated duration
+        repeats: Runs per configuration; the minimum wall time is reported
+        verbose: Print each result
+
+    Returns:
+        List of result records
+    """
+
+    results = []
+    for name in scenarios or SCENARIOS:
+        results.extend(evaluate_scenario(name, candidates, n_samples, duration_scale, repeats, verbose))
+    return results
+
+
+def pareto_front(records, error_key='r_avg_divergence'):
+    """Records not dominated in (wall_time, error_key), sorted by wall time."""
+    front = []
+    best_error = np.inf
+    for record in sorted(records, key=lambda r: (r['wall_time'], r[error_key])):
+        if record[error_key] < best_error:
+            front.append(record)
+            best_error = record[error_key]
+    return front
+
+
+def cheapest_candidates(results, tolerances):
+    """
+    Fastest candidate per scenario whose metrics all meet the tolerances.
+
+    Args:
+        results: Records from run_harness()
+        tolerances: Dict mapping metric name (see METRICS) to its maximum allowed value
+
+    Returns:
+        Dict mapping scenario name to the chosen record, or None if no candidate qualifies
+    """
+
+    chosen = {}
+    for record in results:
+        scenario = record['scenario']
+        chosen.setdefault(scenario, None)
+        if all(record[metric] <= tol for metric, tol in tolerances.items()):
+            best = chosen[scenario]
+            if best is None or record['wall_time'] < best['wall_time']:
+                chosen[scenario] = record
+    return chosen
+
+
+def format_table(results, error_key='r_avg_divergence'):
+    """Per-scenario table sorted by wall time; Pareto-optimal rows in (wall time, error_key) are starred."""
+    lines = []
+    for scenario in dict.fromkeys(r['scenario'] for r in results):
+        records = [r for r in results if r['scenario'] == scenario]
+        front = {id(r) for r in pareto_front(records, error_key)}
+        lines.append(f"\n{scenario} (N={records[0]['N']}, * = Pareto-optimal in wall time vs {error_key})")
+        lines.append(f"  {'candidate':24s} {'dt':>9s} {'force max':>10s} {'force med':>10s} "
+                     f"{'energy':>10s} {'R_avg div':>10s} {'time [s]':>9s} {'speedup':>8s}")
+        for r in sorted(records, key=lambda r: r['wall_time']):
+            mark = '*' if id(r) in front else ' '
+            lines.append(f"{mark} {r['candidate']:24s} {r['dt']:9.2e} {r['force_error_max']:10.2e} "
+                         f"{r['force_error_median']:10.2e} {r['energy_deviation']:10.2e} "
+                         f"{r['r_avg_divergence']:10.2e} {r['wall_time']:9.3f} {r['speedup']:8.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PyParticleSim accuracy-vs-speed harness")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help="Scenarios to run (default: all)")
+    parser.add_argument('--dt-factors', type=float, nargs='+', default=[1.0, 2.0, 4.0, 8.0],
+                        help="Timestep multipliers to evaluate")
+    parser.add_argument('--tabulation', type=float, nargs='+', default=[],
+                        help="Kernel tabulation tolerances to evaluate (at the scenario dt)")
+    parser.add_argument('--samples', type=int, default=20, help="Trajectory samples for energy and R_avg")
+    parser.add_argument('--duration-scale', type=float, default=1.0, help="Multiplier of scenario durations")
+    parser.add_argument('--repeats', type=int, default=1, help="Runs per configuration (minimum wall time is kept)")
+    parser.add_argument('--force-tol', type=float, help="Max per-particle relative force error")
+    parser.add_argument('--energy-tol', type=float, help="Max energy deviation from the reference trajectory, relative to |E_ref(0)|")
+    parser.add_argument('--rdiv-tol', type=float, help="Max relative R_avg divergence")
+    parser.add_argument('--output', help="Write result records to this JSON file")
+    args = parser.parse_args(argv)
+
+    candidates = [Candidate('exact' if f == 1.0 else f'dt x{f:g}', dt_factor=f) for f in args.dt_factors]
+    candidates += [Candidate(f'tabulated {tol:g}', tabulation_tolerance=tol) for tol in args.tabulation]
+
+    results = run_harness(candidates, args.scenarios, args.samples, args.duration_scale, args.repeats)
+    print(format_table(results))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f"\nWrote {args.output}")
+
+    tolerances = {metric: tol for metric, tol in [
+        ('force_error_max', args.force_tol),
+        ('energy_deviation', args.energy_tol),
+        ('r_avg_divergence', args.rdiv_tol),
+    ] if tol is not None}
+    if tolerances:
+        print("\nCheapest configuration meeting " + ', '.join(f"{m} <= {t:g}" for m, t in tolerances.items()))
+        for scenario, record in cheapest_candidates(results, tolerances).items():
+            print(f"  {scenario:16s} {record['candidate'] if record else 'none'}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+"""
+Benchmark Suite with Scaling Curves and Regression Tracking
+
+Times the hot paths of the framework over a sweep of particle counts N and writes the
+results to JSON:
+
+    - SK_Field.compute_forces for every combination of force terms
+    - Verlet_Simulation.step
+    - User_Simulation.step (batched and per-particle force protocols)
+    - SK_Field.compute_forces on randomly shuffled vs Morton-sorted particle storage
+    - Morton reordering itself (key computation, sort and state permutation)
+    - Particle_Structure generators
+    - one find_optimal_lambda objective evaluation (evaluate_collapse_time run until
+      collapse, at dt = 1e-4)
+
+For each (case, N) it records steps/sec, pair interactions/sec and peak traced memory.
+Larger N are skipped once the time predicted from the previous N (via the case's cost
+scaling) exceeds the per-case budget, so the O(N²) paths stop early while the O(N) ones
+reach N = 10⁵.
+
+A run can be compared against a stored baseline JSON; any (case, N) whose throughput
+drops by more than the threshold is reported as a regression and the script exits non-zero.
+
+Usage (from the repository root):
+    python -m src.tools.benchmark --output bench.json --baseline benchmarks/baseline.json
+    python -m src.tools.benchmark --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import src.pyparticlesim as pps
+from src.tools.find_optimal_lambda import evaluate_collapse_time
+
+DEFAULT_N_VALUES = (10, 100, 1000, 10000, 100000)
+
+# Force-term parameter groups, combined in every non-empty subset
+FORCE_TERMS = {
+    'gravity': dict(G=10.0, grav_softening=0.05),
+    'repulsive': dict(k_repulsive=1.0, repulsive_softening=0.05, repulsive_exponent=2),
+    'zeta': dict(k_zeta=8.43, zeta_softening=0.05, omega_zeta=300.0),
+}
+
+
+def _ring(n):
+    """Particle ring used by the field and engine cases."""
+    return pps.Particle_Structure('circle', [0.0, 0.0, 1.0], n)
+
+
+def _field_case(terms):
+    params = {}
+    for term in terms:
+        params.update(FORCE_TERMS[term])
+
+    def setup(n):
+        field = pps.SK_Field(**params)
+        particles = _ring(n).particles
+        return lambda: field.compute_forces(particles, 0.0), n * (n - 1) // 2
+
+    return setup
+
+
+def _ordering_case(sort):
+    def setup(n):
+        field = pps.SK_Field(**FORCE_TERMS['gravity'])
+        state = pps.Particle_Structure('solid_circle', [0.0, 0.0, 1.0], n, seed=0).state
+        state.permute(np.random.default_rng(0).permutation(n))   # Storage order unrelated to space
+        if sort:
+            state.permute(pps.morton_order(state.pos))
+        return lambda: field.compute_forces(state, 0.0), n * (n - 1) // 2
+    return setup
+
+
+def _reorder_case(n):
+    state = pps.Particle_Structure('solid_circle', [0.0, 0.0, 1.0], n, seed=0).state
+    shuffle = np.random.default_rng(0).permutation(n)
+
+    def run():
+        state.permute(shuffle)
+        state.permute(pps.morton_order(state.pos))
+
+    return run, 0
+
+
+def _verlet_case(n):
+    field = pps.SK_Field(**FORCE_TERMS['gravity'], **FORCE_TERMS['zeta'])
+    sim = pps.Verlet_Simulation(_ring(n).state, 1e-5, field)
+    return sim.step, n * (n - 1)   # Two force evaluations per step
+
+
+def _user_batched_case(n):
+    @pps.batched_force
+    def weight(pos, vel, mass):
+        return np.column_stack([np.zeros_like(mass), -9.81 * mass])
+
+    @pps.batched_force
+    def drag(pos, vel, mass):
+        return -0.5 * vel
+
+    sim = pps.User_Simulation(_ring(n).state, 1e-3)
+    return lambda: sim.step(weight, drag), 0
+
+
+def _user_per_particle_case(n):
+    def weight(particle):
+        return np.array([0.0, -9.81 * particle.mass])
+
+    def drag(particle):
+        return -0.5 * particle.vel
+
+    sim = pps.User_Simulation(_ring(n).state, 1e-3)
+    return lambda: sim.step(weight, drag), 0
+
+
+def _structure_case(structure, init_points):
+    def setup(n):
+        return lambda: pps.Particle_Structure(structure, init_points, n, seed=0), 0
+    return setup
+
+
+def _lambda_eval_case(n):
+    # A complete objective evaluation (integrated until collapse), with a coarser timestep
+    # than find_optimal_lambda's default so it stays short; the collapse time is within
+    # about 2% of the dt = 1e-5 result
+    dt = 1e-4
+    run = lambda: evaluate_collapse_time(0.843, n_particles=n, dt=dt, check_interval=10)
+    steps = int(round(run() / dt))   # Deterministic ring, so every call integrates as many steps
+    return run, steps * n * (n - 1)
+
+
+def build_cases():
+    """
+    Registry of benchmark cases.
+
+    Each entry maps a case name to (setup, exponent) where setup(n) returns
+    (callable, pair_interactions_per_call) and exponent is the cost scaling in N
+    used to predict the time of the next N in the sweep.
+    """
+
+    cases = {}
+    for k in range(1, len(FORCE_TERMS) + 1):
+        for terms in itertools.combinations(FORCE_TERMS, k):
+            cases['compute_forces[' + '+'.join(terms) + ']'] = (_field_case(terms), 2)
+    cases['compute_forces[gravity,scattered]'] = (_ordering_case(sort=False), 2)
+    cases['compute_forces[gravity,morton]'] = (_ordering_case(sort=True), 2)
+    cases['morton_reorder'] = (_reorder_case, 1)
+    cases['verlet_step'] = (_verlet_case, 2)
+    cases['user_step[batched]'] = (_user_batched_case, 1)
+    cases['user_step[per_particle]'] = (_user_per_particle_case, 1)
+    for structure, init_points in [
+        ('circle', [0.0, 0.0, 1.0]),
+        ('line', [0.0, 0.0, 1.0, 1.0]),
+        ('rectangle', [0.0, 0.0, 1.0, 1.0]),
+        ('diamond', [0.0, 0.0, 1.0, 1.0]),
+        ('solid_circle', [0.0, 0.0, 1.0]),
+        ('solid_diamond', [0.0, 0.0, 1.0, 1.0]),
+    ]:
+        cases[f'structure[{structure}]'] = (_structure_case(structure, init_points), 1)
+    cases['lambda_evaluation'] = (_lambda_eval_case, 2)
+    return cases
+
+
+def time_call(func, min_time=0.2, max_reps=1000):
+    """Call func repeatedly for at least min_time seconds (at least once); return (reps, elapsed)."""
+    reps = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while reps < max_reps and (reps == 0 or elapsed < min_time):
+        func()
+        reps += 1
+        elapsed = time.perf_counter() - start
+    return reps, elapsed
+
+
+def peak_memory(setup, n):
+    """Peak traced memory in bytes across setup and one call of the case at size n."""
+    tracemalloc.start()
+    try:
+        func, _ = setup(n)
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name, setup, exponent, n_values, budget, min_time, measure_memory=True, verbose=True):
+    """Sweep one case over n_values; returns a list of result records."""
+    n_values = list(n_values)
+    records = []
+    predicted = 0.0
+    for n in n_values:
+        if predicted > budget:
+            records.append({'case': name, 'N': n, 'skipped': True,
+                            'predicted_seconds_per_call': predicted})
+            if verbose:
+                print(f"{name:40s} N={n:>7d}  skipped (predicted {predicted:.2f} s/call)")
+            continue
+
+        func, pairs = setup(n)
+        reps, elapsed = time_call(func, min_time=min_time)
+        per_call = elapsed / reps
+        record = {
+            'case': name,
+            'N': n,
+            'skipped': False,
+            'reps': reps,
+            'seconds_per_call': per_call,
+            'steps_per_sec': 1.0 / per_call,
+            'pairs_per_sec': pairs / per_call,
+            'peak_memory_bytes': peak_memory(setup, n) if measure_memory and per_call < budget else None,
+        }
+        records.append(record)
+        if verbose:
+            print(f"{name:40s} N={n:>7d}  {record['steps_per_sec']:12.2f} steps/s  "
+                  f"{record['pairs_per_sec']:12.3e} pairs/s")
+
+        i = n_values.index(n)
+        if i + 1 < len(n_values):
+            predicted = per_call * (n_values[i + 1] / n) ** exponent
+    return records
+
+
+def run_benchmarks(n_values=DEFAULT_N_VALUES, budget=2.0, min_time=0.2, cases=None, measure_memory=True, verbose=True):
+    """
+    Run the benchmark suite.
+
+    Args:
+        n_values: Particle counts to sweep
+        budget: Skip an N once its predicted seconds per call exceed this
+        min_time: Minimum timing window per (case, N)
+        cases: Case names to run (default: all)
+        measure_memory: Record peak traced memory (runs each case once more under tracemalloc)
+        verbose: Print each result
+
+    Returns:
+        Dict with 'machine' metadata and 'results' records
+    """
+
+    registry = build_cases()
+    selected = cases or list(registry)
+    results = []
+    for name in selected:
+        setup, exponent = registry[name]
+        results.extend(run_case(name, setup, exponent, n_values, budget, min_time, measure_memory, verbose))
+
+    return {
+        'machine': {
+            'node': platform.node(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare_to_baseline(current, baseline, threshold=0.2):
+    """
+    Compare throughput against a baseline report.
+
+    Returns a list of (case, N, baseline_steps_per_sec, current_steps_per_sec, change) for every
+    (case, N) measured in both reports whose steps/sec fell by more than threshold (fractional).
+    """
+
+    reference = {(r['case'], r['N']): r for r in baseline['results'] if not r.get('skipped')}
+    regressions = []
+    for record in current['results']:
+        ref = reference.get((record['case'], record['N']))
+        if record.get('skipped') or ref is None:
+            continue
+        change = record['steps_per_sec'] / ref['steps_per_sec'] - 1.0
+        if change < -threshold:
+            regressions.append((record['case'], record['N'], ref['steps_per_sec'], record['steps_per_sec'], change))
+    return regressions
+
+
+def _write_report(report, path):
+    """Write a JSON report, creating its directory if needed."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PyParticleSim benchmark suite")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write this run's JSON report")
+    parser.add_argument('--baseline', help="Baseline JSON report to compare against")
+    parser.add_argument('--save-baseline', help="Also write this run's report as a baseline to the given path")
+    parser.add_argument('--n', type=int, nargs='+', default=list(DEFAULT_N_VALUES), help="Particle counts to sweep")
+    parser.add_argument('--budget', type=float, default=2.0, help="Max predicted seconds per call before skipping larger N")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum timing window per measurement")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Fractional slowdown flagged as a regression")
+    parser.add_argument('--cases', nargs='+', help="Subset of case names to run")
+    parser.add_argument('--no-memory', action='store_true', help="Skip peak memory measurement")
+    parser.add_argument('--list', action='store_true', help="List case names and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(build_cases()))
+        return 0
+
+    # Fail before the (long) run rather than after it
+    baseline = None
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            parser.error(f"no baseline found at {args.baseline}; run with --save-baseline to create one")
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    report = run_benchmarks(args.n, args.budget, args.min_time, args.cases, not args.no_memory)
+
+    _write_report(report, args.output)
+    print(f"\nWrote {args.output}")
+
+    if args.save_baseline:
+        _write_report(report, args.save_baseline)
+        print(f"Saved baseline {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for case, n, ref, cur, change in regressions:
+                print(f"  {case:40s} N={n:>7d}  {ref:12.2f} -> {cur:12.2f} steps/s ({change:+.1%})")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+"""
+Gradient-Based Lambda Search Using Forward Sensitivities
+
+Companion to find_optimal_lambda.py. Instead of treating each simulation as a black box
+that returns a single scalar, every candidate λ is run with Verlet_Simulation co-integrating
+the tangent-linear equations for k_ζ. Since k_ζ = λG, the chain rule gives
+
+    dR_avg/dλ = G · dR_avg/dk_ζ
+
+and the collapse time t_c, defined implicitly by R_avg(t_c; λ) = collapse_threshold × R₀,
+has the derivative (implicit function theorem)
+
+    dt_c/dλ = -(∂R_avg/∂λ) / (dR_avg/dt)    evaluated at t = t_c
+
+where dR_avg/dt = ⟨r̂ᵢ · vᵢ⟩. One simulation therefore yields both the objective and its
+gradient, so λ* is located with a few secant (for max t_c) or Newton (for R_avg(T) = R₀)
+iterations rather than dozens of golden-section evaluations.
+"""
+
+import numpy as np
+import src.pyparticlesim as pps
+
+
+def evaluate_lambda_with_gradient(
+    lam: float,
+    G: float = 10.0,
+    omega_zeta: float = 300.0,
+    dt: float = 1e-5,
+    max_steps: int = 20000,
+    collapse_threshold: float = 0.95,
+    check_interval: int = 100,
+    n_particles: int = 100,
+    R0: float = 1.0,
+    grav_softening: float = 0.05,
+) -> dict:
+    """
+    Run one ring simulation at λ with k_ζ sensitivities and return diagnostics and gradients.
+
+    The collapse time is refined by linearizing R_avg(t) about the step at which collapse is
+    detected, which makes t_c a smooth function of λ instead of a multiple of check_interval·dt.
+
+    Returns:
+        Dict with keys:
+            't_collapse'  : collapse time (max_steps·dt if no collapse was detected)
+            'dt_dlambda'  : dt_c/dλ (0.0 if no collapse was detected)
+            'collapsed'   : whether collapse was detected
+            'R_avg'       : mean radius at the end of the run
+            'dR_dlambda'  : dR_avg/dλ at the end of the run
+    """
+
+    struct = pps.Particle_Structure('circle', [0.0, 0.0, R0], n_particles)
+    field = pps.SK_Field(
+        G=G,
+        grav_softening=grav_softening,
+        omega_zeta=omega_zeta,
+        k_zeta=lam * G,
+        zeta_softening=grav_softening,
+    )
+    sim = pps.Verlet_Simulation(struct.state, dt, field, sensitivity_params=('k_zeta',))
+
+    for step in range(max_steps):
+        sim.step()
+
+        if step % check_interval == 0:
+            pos, vel = sim.state.pos, sim.state.vel
+            radii = np.linalg.norm(pos, axis=1)
+            R_avg = np.mean(radii)
+            dR_dlambda = G * sim.radius_sensitivity('k_zeta')
+
+            if R_avg < collapse_threshold * R0:
+                dR_dt = np.mean(np.sum(pos * vel, axis=1) / radii)
+                t_collapse = sim.time - (R_avg - collapse_threshold * R0) / dR_dt
+                return {
+                    't_collapse': t_collapse,
+                    'dt_dlambda': -dR_dlambda / dR_dt,
+                    'collapsed': True,
+                    'R_avg': R_avg,
+                    'dR_dlambda': dR_dlambda,
+                }
+
+    R_avg = np.mean(np.linalg.norm(sim.state.pos, axis=1))
+    return {
+        't_collapse': sim.time,
+        'dt_dlambda': 0.0,
+        'collapsed': False,
+        'R_avg': R_avg,
+        'dR_dlambda': G * sim.radius_sensitivity('k_zeta'),
+    }
+
+
+def find_optimal_lambda_secant(
+    lambda_min: float = 0.7,
+    lambda_max: float = 1.0,
+    tolerance: float = 0.001,
+    max_iterations: int = 10,
+    verbose: bool = True,
+    **sim_kwargs
+) -> tuple[float, float]:
+    """
+    Maximize collapse time t_c(λ) by secant iteration on dt_c/dλ = 0.
+
+    Starts from the two golden-section interior points of [λ_min, λ_max] and keeps every
+    iterate inside that interval. A candidate that never collapses within max_steps has
+    zero gradient (the same plateau golden-section search would settle on), which ends
+    the iteration. Where t_c is not locally concave the secant step is replaced by an
+    expanding step in the uphill direction.
+
+    Args:
+        lambda_min, lambda_max: Search interval for λ
+        tolerance: Stop when successive iterates differ by less than this
+        max_iterations: Upper bound on secant updates
+        verbose: Print each iterate
+        **sim_kwargs: Forwarded to evaluate_lambda_with_gradient (G, omega_zeta, dt, ...)
+
+    Returns:
+        (lambda_optimal, t_optimal)
+    """
+
+    resphi = 2 - (1 + np.sqrt(5)) / 2
+    lam_prev = lambda_min + resphi * (lambda_max - lambda_min)
+    lam = lambda_max - resphi * (lambda_max - lambda_min)
+
+    prev = evaluate_lambda_with_gradient(lam_prev, **sim_kwargs)
+    curr = evaluate_lambda_with_gradient(lam, **sim_kwargs)
+
+    if verbose:
+        print(f"Starting secant search: λ ∈ [{lambda_min:.4f}, {lambda_max:.4f}]")
+        print(f"λ={lam_prev:.6f}: t={prev['t_collapse']:.6f}, dt/dλ={prev['dt_dlambda']:.6f}")
+        print(f"λ={lam:.6f}: t={curr['t_collapse']:.6f}, dt/dλ={curr['dt_dlambda']:.6f}")
+
+    for iteration in range(max_iterations):
+        g_prev, g = prev['dt_dlambda'], curr['dt_dlambda']
+        if g == 0.0 or g == g_prev:
+            break
+
+        curvature = (g - g_prev) / (lam - lam_prev)
+        if curvature < 0:
+            lam_next = lam - g / curvature
+        else:
+            # Not locally concave: the secant step would head for a minimum, so expand uphill instead
+            lam_next = lam + np.sign(g) * 2 * abs(lam - lam_prev)
+        lam_next = min(max(lam_next, lambda_min), lambda_max)
+        lam_prev, prev = lam, curr
+        lam = lam_next
+        curr = evaluate_lambda_with_gradient(lam, **sim_kwargs)
+
+        if verbose:
+            print(f"Iteration {iteration + 1}: λ={lam:.6f}, t={curr['t_collapse']:.6f}, "
+                  f"dt/dλ={curr['dt_dlambda']:.6f}")
+
+        if abs(lam - lam_prev) < tolerance:
+            break
+
+    best_lam, best = max(((lam_prev, prev), (lam, curr)), key=lambda item: item[1]['t_collapse'])
+
+    if verbose:
+        print(f"Optimal λ* = {best_lam:.6f} with collapse time t = {best['t_collapse']:.6f}")
+
+    return best_lam, best['t_collapse']
+
+
+def find_balanced_lambda_newton(
+    lambda_init: float = 0.85,
+    n_steps: int = 4000,
+    tolerance: float = 1e-4,
+    max_iterations: int = 8,
+    verbose: bool = True,
+    **sim_kwargs
+) -> tuple[float, float]:
+    """
+    Solve R_avg(T; λ) = R₀ at T = n_steps·dt by Newton iteration using dR_avg/dλ.
+
+    This is the criterion behind the data/lambda_scan_* brute-force scans, which look for
+    the λ whose ring returns to R₀ after a fixed number of steps.
+
+    Args:
+        lambda_init: Starting guess for λ
+        n_steps: Number of steps defining the target time T
+        tolerance: Stop when the Newton update is smaller than this
+        max_iterations: Upper bound on Newton updates
+        verbose: Print each iterate
+        **sim_kwargs: Forwarded to evaluate_lambda_with_gradient (G, omega_zeta, dt, ...)
+
+    Returns:
+        (lambda_balanced, R_avg) with R_avg the mean radius reached at T
+    """
+
+    R0 = sim_kwargs.get('R0', 1.0)
+    # Disable collapse detection so every run reaches T
+    sim_kwargs = dict(sim_kwargs, max_steps=n_steps, collapse_threshold=-np.inf)
+
+    lam = lambda_init
+    for iteration in range(max_iterations):
+        result = evaluate_lambda_with_gradient(lam, **sim_kwargs)
+        update = (result['R_avg'] - R0) / result['dR_dlambda']
+        lam -= update
+
+        if verbose:
+            print(f"Iteration {iteration + 1}: R_avg={result['R_avg']:.6f}, "
+                  f"dR/dλ={result['dR_dlambda']:.6f}, next λ={lam:.6f}")
+
+        if abs(update) < tolerance:
+            break
+
+    return lam, evaluate_lambda_with_gradient(lam, **sim_kwargs)['R_avg']
+
+
+# Example usage
+if __name__ == "__main__":
+    lambda_star, time_star = find_optimal_lambda_secant(
+        lambda_min=0.75,
+        lambda_max=0.95,
+        max_steps=15000,
+    )
+
+    print("\n" + "="*70)
+    print(f"RESULT: λ* = {lambda_star:.4f} maximizes transient stability")
+    print(f"        with collapse time t* = {time_star:.4f}")
+    print("="*70)
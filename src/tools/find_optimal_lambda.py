@@ -24,6 +24,55 @@ Mathematical Foundation:
 import numpy as np
 import src.pyparticlesim as pps
 
+def evaluate_collapse_time(
+    lam: float,
+    G: float = 10.0,
+    omega_zeta: float = 300.0,
+    dt: float = 1e-5,
+    max_steps: int = 20000,
+    collapse_threshold: float = 0.95,
+    check_interval: int = 100,
+    n_particles: int = 100,
+    R0: float = 1.0,
+    grav_softening: float = 0.05,
+) -> float:
+    """
+    Execute one full N-body ring simulation for given λ and return its collapse time.
+
+    This is the objective evaluated by find_optimal_lambda(); parameters have the same
+    meaning as there. Returns max_steps × dt if no collapse is detected.
+    """
+    
+    # Initialize particle ring
+    struct = pps.Particle_Structure('circle', [0.0, 0.0, R0], n_particles)
+    
+    # Configure force field with time-varying repulsion
+    field = pps.SK_Field(
+        G=G,
+        grav_softening=grav_softening,
+        omega_zeta=omega_zeta,
+        k_zeta=lam * G,
+        zeta_softening=grav_softening,
+    )
+    
+    # Initialize velocity Verlet integrator
+    sim = pps.Verlet_Simulation(struct.state, dt, field)
+    
+    # Integrate until collapse or maximum time
+    for step in range(max_steps):
+        sim.step()
+        
+        # Periodic collapse detection
+        if step % check_interval == 0:
+            radii = np.linalg.norm(sim.state.pos, axis=1)
+            R_avg = np.mean(radii)
+            
+            if R_avg < collapse_threshold * R0:
+                return sim.time
+    
+    # Return maximum time if no collapse detected
+    return sim.time
+
 def find_optimal_lambda(
     lambda_min: float = 0.7,
     lambda_max: float = 1.0,
@@ -200,36 +249,11 @@ def find_optimal_lambda(
     # Helper function to run simulation and measure collapse time
     def evaluate_lambda(lam: float) -> float:
         """Execute full N-body simulation for given λ and return collapse time."""
-        
-        # Initialize particle ring
-        struct = pps.Particle_Structure('circle', [0.0, 0.0, R0], n_particles)
-        
-        # Configure force field with time-varying repulsion
-        field = pps.SK_Field(
-            G=G,
-            grav_softening=grav_softening,
-            omega_zeta=omega_zeta,
-            k_zeta=lam * G,
-            zeta_softening=grav_softening,
+        return evaluate_collapse_time(
+            lam, G=G, omega_zeta=omega_zeta, dt=dt, max_steps=max_steps,
+            collapse_threshold=collapse_threshold, check_interval=check_interval,
+            n_particles=n_particles, R0=R0, grav_softening=grav_softening,
         )
-        
-        # Initialize velocity Verlet integrator
-        sim = pps.Verlet_Simulation(struct.particles, dt, field)
-        
-        # Integrate until collapse or maximum time
-        for step in range(max_steps):
-            sim.step()
-            
-            # Periodic collapse detection
-            if step % check_interval == 0:
-                radii = [np.linalg.norm(p.pos) for p in sim.particles]
-                R_avg = np.mean(radii)
-                
-                if R_avg < collapse_threshold * R0:
-                    return sim.time
-        
-        # Return maximum time if no collapse detected
-        return sim.time
     
     # Evaluate collapse times at initial interior points
     fc = evaluate_lambda(c)
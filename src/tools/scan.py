@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Kamyar Modjtahedzadeh"
+
+"""
+Resumable Parameter Scan Orchestrator
+
+Runs declarative parameter studies over SK_Field / Verlet_Simulation parameters on a
+bounded local process pool driven by an asyncio event loop. Every completed point is
+persisted immediately to a results directory:
+
+    results.npy    object array of dicts, the record format of the lambda_scan_results.npy
+                   files of data/lambda_scan_* runs (renamed, since scans are not limited to λ)
+    metadata.json  the scan spec, machine info and progress counters
+    output.out     one text line per completed point
+
+Re-running the same spec on the same directory resumes the scan: finished points are
+skipped. Progress, throughput and ETA are streamed while the scan runs.
+
+Spec (JSON file or dict):
+
+    {
+        "fixed":  {"G": 10.0, "grav_softening": 0.05, "omega_zeta": 300,
+                   "dt": 1e-5, "n_steps": 4000, "n_particles": 100},
+        "grid":   {"lambda": {"linspace": [0.8, 0.9, 10]}},
+        "search": {"param": "lambda", "bounds": [0.5, 2.0], "points": 8, "rounds": 3,
+                   "metric": "R_avg", "target": 1.0}
+    }
+
+"grid" values are lists or {"linspace": [a, b, n]}, {"logspace": [a, b, n]},
+{"arange": [a, b, step]}; the grid is their Cartesian product. "search" (optional,
+instead of or after the grid) evaluates `points` (at least 2, default max(4, 2 × workers))
+values of one parameter per round in parallel and zooms into the neighbourhood of the
+best point, which is the one with metric closest to `target`, or the largest/smallest
+with "goal": "max"/"min". Every round at least halves the interval, which stays inside
+"bounds" (it is shifted inward when the best point lies near an edge).
+
+Point parameters are interpreted by run_point(): dt, n_steps, n_particles, structure,
+init_points (default: unit circle), seed, lambda (k_ζ = λG, as in
+find_optimal_lambda.py, with ζ softening defaulting to grav_softening) and autotune
+(use Auto_Tuned_Field instead of SK_Field) configure the run; every other parameter is
+passed to the field. Each point records R_avg and R_std
+after n_steps plus its wall time.
+
+Usage (from the repository root):
+    python -m src.tools.scan scan.json --output data/lambda_scan_2cycle_n4000 --workers 4
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import src.pyparticlesim as pps
+
+RUN_PARAMS = ('dt', 'n_steps', 'n_particles', 'structure', 'init_points', 'seed', 'lambda', 'autotune')
+
+
+def run_point(point):
+    """
+    Run one Verlet simulation for a scan point and return its diagnostics.
+
+    Returns:
+        Dict with 'R_avg' and 'R_std' (distances from the origin after n_steps) and 'wall_time'
+    """
+
+    start = time.perf_counter()
+    params = {k: v for k, v in point.items() if k not in RUN_PARAMS}
+    if 'lambda' in point:
+        params.setdefault('k_zeta', point['lambda'] * params['G'])
+        params.setdefault('zeta_softening', params.get('grav_softening', 0.05))
+
+    struct = pps.Particle_Structure(
+        point.get('structure', 'circle'),
+        point.get('init_points', [0.0, 0.0, 1.0]),
+        int(point.get('n_particles', 100)),
+        seed=point.get('seed'),
+    )
+    field = pps.Auto_Tuned_Field(**params) if point.get('autotune') else pps.SK_Field(**params)
+    sim = pps.Verlet_Simulation(struct.state, point['dt'], field)
+    sim.run(int(point['n_steps']))
+
+    radii = np.linalg.norm(sim.state.pos, axis=1)
+    return {'R_avg': float(np.mean(radii)), 'R_std': float(np.std(radii)), 'wall_time': time.perf_counter() - start}
+
+
+def _values(spec):
+    """Expand one grid axis specification into a list of values."""
+    if isinstance(spec, dict):
+        (kind, args), = spec.items()
+        if kind == 'linspace':
+            return np.linspace(args[0], args[1], int(args[2])).tolist()
+        if kind == 'logspace':
+            return np.logspace(args[0], args[1], int(args[2])).tolist()
+        if kind == 'arange':
+            return np.arange(*args).tolist()
+        raise ValueError(f"Unknown grid axis kind: {kind}")
+    return list(spec)
+
+
+def expand_grid(grid):
+    """Cartesian product of the grid axes as a list of parameter dicts."""
+    if not grid:
+        return []
+    names = list(grid)
+    axes = [_values(grid[name]) for name in names]
+    return [dict(zip(names, combo)) for combo in itertools.product(*axes)]
+
+
+def point_key(point):
+    """Canonical string identifying a point (floats rounded to 12 significant digits)."""
+    canonical = {k: (float(f"{v:.12g}") if isinstance(v, float) else v) for k, v in point.items()}
+    return json.dumps(canonical, sort_keys=True)
+
+
+class Results_Store:
+    """
+    Directory holding the completed points of one scan.
+
+    Each record is a dict of the scanned parameters and the evaluated outputs. Files are
+    rewritten atomically (temporary file + os.replace) after every record, so an
+    interrupted scan never leaves a truncated store behind.
+    """
+
+    def __init__(self, directory, spec):
+        """
+        Args:
+            directory: Results directory (created if missing)
+            spec: Scan spec; resuming with a different spec raises ValueError
+        """
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.results_path = os.path.join(directory, 'results.npy')
+        self.metadata_path = os.path.join(directory, 'metadata.json')
+        self.log_path = os.path.join(directory, 'output.out')
+
+        self.metadata = {'spec': spec, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path) as fh:
+                stored = json.load(fh)
+            if stored['spec'] != json.loads(json.dumps(spec)):
+                raise ValueError(f"{directory} holds a scan with a different spec; use another directory")
+            self.metadata = stored
+
+        self.records = []
+        if os.path.exists(self.results_path):
+            self.records = list(np.load(self.results_path, allow_pickle=True))
+        self.keys = {r['key'] for r in self.records}
+
+    def _write(self, path, write):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fh:
+            write(fh)
+        os.replace(tmp, path)
+
+    def add(self, point, outputs, line):
+        """Persist one completed point and append its text line to output.out."""
+        record = dict(point, **outputs, key=point_key(point))
+        self.records.append(record)
+        self.keys.add(record['key'])
+
+        array = np.empty(len(self.records), dtype=object)
+        array[:] = self.records
+        self._write(self.results_path, lambda fh: np.save(fh, array, allow_pickle=True))
+
+        self.metadata.update(
+            completed=len(self.records),
+            updated=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            machine={'node': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__},
+        )
+        self._write(self.metadata_path, lambda fh: fh.write(json.dumps(self.metadata, indent=2).encode()))
+        with open(self.log_path, 'a') as fh:
+            fh.write(line + '\n')
+        return record
+
+
+class Scan_Orchestrator:
+    """
+    Schedules the points of a scan spec onto a bounded process pool from an asyncio loop.
+
+    At most `workers` points are in flight; each result is persisted as soon as it arrives,
+    so the scan can be interrupted at any time and resumed by running it again.
+    """
+
+    def __init__(self, spec, directory, workers=None, evaluate=run_point, progress=print):
+        """
+        Args:
+            spec: Scan spec dict (see module docstring)
+            directory: Results directory
+            workers: Maximum concurrent worker processes (default: os.cpu_count())
+            evaluate: Picklable module-level callable(point) -> dict of outputs (default: run_point)
+            progress: Callable receiving one status line per completed point (default: print)
+        """
+
+        self.spec = spec
+        self.store = Results_Store(directory, spec)
+        self.workers = workers or os.cpu_count() or 1
+        self.evaluate = evaluate
+        self.progress = progress
+
+    def run(self):
+        """Run (or resume) the whole scan; returns all completed records."""
+        return asyncio.run(self._run())
+
+    async def _run(self):
+        fixed = self.spec.get('fixed', {})
+        self._start = time.perf_counter()
+        self._done_now = 0
+        with ProcessPoolExecutor(self.workers) as pool:
+            self._pool = pool
+            self._slots = asyncio.Semaphore(self.workers)
+            grid = [dict(fixed, **p) for p in expand_grid(self.spec.get('grid'))]
+            await self._evaluate_all(grid)
+            if 'search' in self.spec:
+                await self._search(fixed, self.spec['search'])
+        return self.store.records
+
+    async def _evaluate_all(self, points):
+        """Evaluate every point not already in the store; returns records for all points."""
+        todo = [p for p in dict((point_key(p), p) for p in points).values() if point_key(p) not in self.store.keys]
+        self._total = len(self.store.records) + len(todo)
+        await asyncio.gather(*(self._evaluate(p) for p in todo))
+        by_key = {r['key']: r for r in self.store.records}
+        return [by_key[point_key(p)] for p in points]
+
+    async def _evaluate(self, point):
+        async with self._slots:
+            outputs = await asyncio.get_running_loop().run_in_executor(self._pool, self.evaluate, point)
+        self._done_now += 1
+        done = len(self.store.records) + 1
+        elapsed = time.perf_counter() - self._start
+        rate = self._done_now / elapsed
+        eta = (self._total - done) / rate if rate > 0 else float('inf')
+        scanned = ', '.join(f"{k}={v:.6g}" if isinstance(v, float) else f"{k}={v}"
+                            for k, v in point.items() if k not in self.spec.get('fixed', {}))
+        results = ', '.join(f"{k}={v:.6g}" for k, v in outputs.items() if isinstance(v, float) and k != 'wall_time')
+        line = f"{scanned}: {results}"
+        self.store.add(point, outputs, line)
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if np.isfinite(eta) else '?'
+        self.progress(f"[{done}/{self._total}] {line}  ({outputs.get('wall_time', 0.0):.1f} s) | "
+                      f"{60 * rate:.2f} points/min, ETA {eta_text}")
+
+    async def _search(self, fixed, search):
+        """Zoom search over one parameter: evaluate a grid per round, then narrow around the best point."""
+        name = search['param']
+        low, high = lower, upper = search['bounds']
+        n = int(search.get('points', max(4, 2 * self.workers)))
+        if n < 2:
+            raise ValueError(f"search needs at least 2 points per round, got {n}")
+        metric = search['metric']
+        if 'target' in search:
+            score = lambda r: abs(r[metric] - search['target'])
+        elif search.get('goal', 'max') == 'max':
+            score = lambda r: -r[metric]
+        else:
+            score = lambda r: r[metric]
+
+        for _ in range(int(search.get('rounds', 3))):
+            values = np.linspace(low, high, n)
+            records = await self._evaluate_all([dict(fixed, **{name: float(v)}) for v in values])
+            best = min(range(n), key=lambda i: score(records[i]))
+            # ±1 grid spacing around the best point, but never wider than half the interval
+            half_width = min(values[1] - values[0], 0.25 * (high - low))
+            low, high = values[best] - half_width, values[best] + half_width
+            shift = max(lower - low, 0.0) - max(high - upper, 0.0)   # Keep the window inside the bounds
+            low, high = low + shift, high + shift
+        self.progress(f"Search best: {name}={values[best]:.6g} ({metric}={records[best][metric]:.6g})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable PyParticleSim parameter scan")
+    parser.add_argument('spec', help="Scan spec JSON file")
+    parser.add_argument('--output', required=True, help="Results directory (resumed if it exists)")
+    parser.add_argument('--workers', type=int, help="Maximum concurrent worker processes")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as fh:
+        spec = json.load(fh)
+    orchestrator = Scan_Orchestrator(spec, args.output, args.workers)
+    try:
+        records = orchestrator.run()
+    except KeyboardInterrupt:
+        print(f"\nInterrupted: {len(orchestrator.store.records)} points saved in {args.output}; "
+              f"run the same command again to resume")
+        return 130
+    print(f"\n{len(records)} points in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,29 +3,80 @@
 
 __author__ = "Kamyar Modjtahedzadeh"
 
+try:
+    # If imported from ~/workspace
+    from src.force_terms import Force_Workspace
+    from src.particles_and_structures import Particle_State
+    from src.profiling import NULL_PROFILER
+except ImportError:
+    # If imported from ~/workspace/src
+    from force_terms import Force_Workspace
+    from particles_and_structures import Particle_State
+    from profiling import NULL_PROFILER
+
+import inspect
 import numpy as np
 
 
+def _accepts_workspace(compute_forces):
+    """True if a field's compute_forces takes the out= and workspace= buffers (as SK_Field does)."""
+    try:
+        parameters = inspect.signature(compute_forces).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'out' in parameters and 'workspace' in parameters
+
+
 class Verlet_Simulation:
     """
     Velocity Verlet simulation engine with proper force re-evaluation.
     
     Implements 2nd-order symplectic integration by recomputing forces
     after position update. Compatible with SK_Field.compute_forces().
+
+    Optionally co-integrates the tangent-linear (forward sensitivity) equations
+    for selected field parameters, giving dr/dp and dv/dp alongside the trajectory.
+
+    With a reordering policy (e.g. Morton_Reordering) the state rows, and the sensitivity
+    arrays with them, are periodically re-sorted for memory locality; use state.ids or
+    state.by_id() to relate rows to original particles.
+
+    Forces, accelerations, drift/kick scratch and the pair-tile buffers of the field live in
+    a workspace allocated once per particle count, so a step performs no large allocations
+    (the sensitivity path still uses dense temporaries).
     """
     
-    def __init__(self, particles, dt, field):
+    def __init__(self, particles, dt, field, sensitivity_params=None, profiler=None, reordering=None):
         """
         Args:
-            particles: Array of Particle objects
+            particles: Array of Particle objects or a Particle_State
             dt: Timestep
             field: SK_Field instance for force computation
+            sensitivity_params: Field parameter names to differentiate with respect to,
+                e.g. ('k_zeta',). Must be listed in field.SENSITIVITY_PARAMS (default: None)
+            profiler: Profiler for per-phase timings of force, drift, kick and sensitivity
+                updates (default: disabled)
+            reordering: Policy with order(pos) -> permutation or None, consulted after every step,
+                e.g. Morton_Reordering (default: None, never reorder)
         """
         
-        self.particles = np.array(particles)
+        self.state = Particle_State.from_particles(particles)
         self.dt = dt
         self.field = field
         self.time = 0.0
+        self.profiler = profiler or NULL_PROFILER
+        self.reordering = reordering
+        self.workspace = Force_Workspace()
+        self._field_buffers = _accepts_workspace(field.compute_forces)
+        self._buffers_n = None
+
+        # Tangent state dr/dp and dv/dp, zero at t=0 since initial conditions do not depend on p
+        self.sensitivities = {}
+        for param in sensitivity_params or ():
+            if param not in field.SENSITIVITY_PARAMS:
+                raise ValueError(f"Unsupported sensitivity parameter: {param}")
+            n = len(self.state)
+            self.sensitivities[param] = {'pos': np.zeros((n, 2)), 'vel': np.zeros((n, 2))}
     
     def step(self):
         """
@@ -37,27 +88,98 @@ class Verlet_Simulation:
             3. Recompute F(t+Δt) from new positions
             4. Compute a(t+Δt) = F(t+Δt)/m
             5. Update v(t+Δt) = v(t) + (1/2)[a(t) + a(t+Δt)]Δt
+
+        Sensitivities follow the same scheme with a = F/m replaced by (dF/dp)/m.
         """
         
-        n = len(self.particles)
+        state = self.state
+        mass = state.mass[:, None]
+        prof = self.profiler
+        if self._buffers_n != len(state):
+            self._allocate_buffers(len(state))
+        accel_old, accel_new, scratch, scratch2 = self._accel_old, self._accel_new, self._scratch, self._scratch2
         
         # Step 1: Compute and store current accelerations
-        forces_old = self.field.compute_forces(self.particles, self.time)
-        accel_old = np.array([forces_old[i] / self.particles[i].mass for i in range(n)])
+        with prof.phase('force'):
+            np.divide(self._compute_forces(self.time), mass, out=accel_old)
+        if self.sensitivities:
+            with prof.phase('sensitivity'):
+                sens_accel_old = self._sensitivity_accelerations(self.time)
         
-        # Step 2: Update positions
-        for i, particle in enumerate(self.particles):
-            particle.pos += particle.vel * self.dt + 0.5 * accel_old[i] * self.dt**2
+        # Step 2: Update positions, r += v·Δt + (1/2)a·Δt² evaluated in place
+        with prof.phase('drift'):
+            np.multiply(accel_old, 0.5, out=scratch2)
+            scratch2 *= self.dt**2
+            np.multiply(state.vel, self.dt, out=scratch)
+            scratch += scratch2
+            state.pos += scratch
+            for param, tangent in self.sensitivities.items():
+                tangent['pos'] += tangent['vel'] * self.dt + 0.5 * sens_accel_old[param] * self.dt**2
         
         # Step 3: Recompute forces at new positions
-        forces_new = self.field.compute_forces(self.particles, self.time + self.dt)
+        with prof.phase('force'):
+            forces_new = self._compute_forces(self.time + self.dt)
         
         # Steps 4-5: Update velocities with averaged acceleration
-        for i, particle in enumerate(self.particles):
-            accel_new = forces_new[i] / particle.mass
-            particle.vel += 0.5 * (accel_old[i] + accel_new) * self.dt
+        with prof.phase('kick'):
+            np.divide(forces_new, mass, out=accel_new)
+            np.add(accel_old, accel_new, out=scratch)
+            scratch *= 0.5
+            scratch *= self.dt
+            state.vel += scratch
+        if self.sensitivities:
+            with prof.phase('sensitivity'):
+                sens_accel_new = self._sensitivity_accelerations(self.time + self.dt)
+                for param, tangent in self.sensitivities.items():
+                    tangent['vel'] += 0.5 * (sens_accel_old[param] + sens_accel_new[param]) * self.dt
         
         self.time += self.dt
+
+        if self.reordering is not None:
+            with prof.phase('reorder'):
+                order = self.reordering.order(state.pos)
+                if order is not None:
+                    state.permute(order)
+                    for tangent in self.sensitivities.values():
+                        tangent['pos'][:] = tangent['pos'][order]
+                        tangent['vel'][:] = tangent['vel'][order]
+
+    def _allocate_buffers(self, n):
+        """(Re)allocate the per-step arrays for n particles."""
+        self._forces, self._accel_old, self._accel_new, self._scratch, self._scratch2 = (
+            np.empty((n, 2)) for _ in range(5))
+        self._buffers_n = n
+
+    def _compute_forces(self, time):
+        """Field forces at the current positions, written into the workspace when the field supports it."""
+        if self._field_buffers:
+            return self.field.compute_forces(self.state, time, out=self._forces, workspace=self.workspace)
+        return self.field.compute_forces(self.state, time)
+
+    def _sensitivity_accelerations(self, time):
+        """Tangent accelerations (dF/dp)/m at the current positions for every tracked parameter."""
+        tangents = {param: tangent['pos'] for param, tangent in self.sensitivities.items()}
+        dforces = self.field.compute_force_sensitivities(self.state, tangents, time)
+        mass = self.state.mass[:, None]
+        return {param: df / mass for param, df in dforces.items()}
+
+    @property
+    def particles(self):
+        """Array of Particle objects viewing the simulation state, in original particle order."""
+        return self.state.particles
+
+    def radius_sensitivity(self, param, center=(0.0, 0.0)):
+        """
+        Derivative dR_avg/dp of the mean distance from center with respect to a tracked parameter.
+
+        Args:
+            param: Parameter name passed in sensitivity_params
+            center: Reference point for the radius (default: origin)
+        """
+
+        offsets = self.state.pos - np.asarray(center, dtype=float)
+        r_hat = offsets / np.linalg.norm(offsets, axis=1)[:, None]
+        return np.mean(np.sum(r_hat * self.sensitivities[param]['pos'], axis=1))
     
     def run(self, n_steps: int):
         """Run simulation for n_steps timesteps."""